@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Headless benchmarks of the REPL output pipeline (ReplReader, Repl.read
+   decoding, ANSI filtering, ReplView writes).
+
+   Run from the package directory:
+
+       python -m benchmarks [--size MB] [--set setting=json_value ...] [scenario ...]
+
+   sublime and sublime_plugin are replaced with the stubs in
+   benchmarks/stubs, where a view is an in-memory text buffer."""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import io
+import os
+import re
+import sys
+import json
+import importlib
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+PACKAGE = "SublimeREPL"
+
+
+def strip_json_comments(text):
+    """Sublime settings allow // comments and trailing commas"""
+    text = re.sub(r'("(?:\\.|[^"\\])*")|//[^\n]*', lambda m: m.group(1) or "", text)
+    return re.sub(r",(\s*[}\]])", r"\1", text)
+
+
+def load_plugin(overrides=None):
+    """Imports sublimerepl on top of stubs with default settings updated by
+       overrides. Returns (sublime, sublimerepl) modules"""
+    sys.path.insert(0, STUBS)
+    import sublime
+
+    with io.open(os.path.join(ROOT, "SublimeREPL.sublime-settings"), encoding="utf-8") as f:
+        defaults = json.loads(strip_json_comments(f.read()))
+    settings = sublime.load_settings("SublimeREPL.sublime-settings")
+    settings.update(defaults)
+    settings.update(overrides or {})
+
+    if PACKAGE not in sys.modules:
+        # the package directory may have any name on disk
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = package
+        spec.loader.exec_module(package)
+    return sublime, importlib.import_module(PACKAGE + ".sublimerepl")
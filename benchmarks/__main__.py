@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Runs output pipeline scenarios and prints throughput and drain latency"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from . import load_plugin
+
+BURSTY = r"""
+import sys, time
+for burst in range(200):
+    for i in range(200):
+        sys.stdout.write("burst %d line %d\n" % (burst, i))
+        sys.stdout.flush()
+    time.sleep(0.005)
+"""
+
+COLORED = r"""
+import sys
+colors = [31, 32, 33, 34, 35, 36]
+for i in range(100000):
+    c = colors[i % len(colors)]
+    sys.stdout.write("\x1b[1;%dmPASSED\x1b[0m test_%d \x1b[%dm[%d%%]\x1b[0m\n" % (c, i, c, i % 100))
+"""
+
+PROGRESS = r"""
+import sys
+for i in range(200000):
+    sys.stdout.write("\r%6.2f%% |%-50s|" % (i / 2000.0, "#" * (i // 4000)))
+sys.stdout.write("\ndone\n")
+"""
+
+
+def python(source):
+    return [sys.executable, "-u", "-c", source]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+class Scenario(object):
+    def __init__(self, name, cmd):
+        self.name = name
+        self.cmd = cmd
+
+    def run(self, sublime, sublimerepl, timeout):
+        window = sublime.active_window()
+        rv = sublimerepl.manager.open(window, "utf-8", "subprocess", cmd=self.cmd)
+        drains = []
+        delays = []
+        notified = []
+        state = {"closed": False}
+
+        schedule_update = rv.schedule_update
+        handle_repl_output = rv.handle_repl_output
+
+        def timed_schedule_update():
+            notified.append(time.time())
+            schedule_update()
+
+        def timed_handle_repl_output():
+            start = time.time()
+            if notified:
+                delays.append(start - notified[0])
+                del notified[:]
+            is_still_working = handle_repl_output()
+            drains.append(time.time() - start)
+            state["closed"] = not is_still_working
+            return is_still_working
+
+        rv.schedule_update = timed_schedule_update
+        rv._repl_reader.on_output = timed_schedule_update
+        rv.handle_repl_output = timed_handle_repl_output
+
+        start = time.time()
+        finished = sublime.run_until(lambda: state["closed"], timeout)
+        elapsed = time.time() - start
+        rv.on_close()
+        return {
+            "scenario": self.name,
+            "finished": finished,
+            "seconds": elapsed,
+            "bytes": rv.repl.bytes_read,
+            "throughput": rv.repl.bytes_read / elapsed,
+            "drains": len(drains),
+            "drain_p50": percentile(drains, 50),
+            "drain_p99": percentile(drains, 99),
+            "latency_p50": percentile(delays, 50),
+            "latency_p99": percentile(delays, 99),
+            "view_size": rv.view.size(),
+        }
+
+
+def make_file(size):
+    f = tempfile.NamedTemporaryFile(prefix="sublimerepl-bench-", suffix=".txt", delete=False)
+    line = b"".join(b"%d " % i for i in range(20)) + b"\n"
+    written = 0
+    chunk = line * (1024 * 1024 // len(line))
+    while written < size:
+        f.write(chunk)
+        written += len(chunk)
+    f.close()
+    return f.name
+
+
+def parse_setting(text):
+    key, _, value = text.partition("=")
+    return key, json.loads(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("scenarios", nargs="*", help="cat, bursty, colored, progress (default: all)")
+    parser.add_argument("--size", type=int, default=100, help="size of the file for cat, in MB")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per scenario")
+    parser.add_argument("--set", action="append", default=[], type=parse_setting, metavar="KEY=JSON",
+                        help="override SublimeREPL setting, eg. --set output_drain_limit=0")
+    parser.add_argument("--json", action="store_true", help="print results as json lines")
+    args = parser.parse_args(argv)
+
+    sublime, sublimerepl = load_plugin(dict(args.set))
+    cat_file = None
+    names = args.scenarios or ["cat", "bursty", "colored", "progress"]
+    if "cat" in names:
+        cat_file = make_file(args.size * 1024 * 1024)
+    scenarios = {
+        "cat": lambda: Scenario("cat", ["cat", cat_file]),
+        "bursty": lambda: Scenario("bursty", python(BURSTY)),
+        "colored": lambda: Scenario("colored", python(COLORED)),
+        "progress": lambda: Scenario("progress", python(PROGRESS)),
+    }
+
+    if not args.json:
+        print("%-10s %9s %10s %11s %7s %18s %18s %10s" % (
+            "scenario", "seconds", "MB", "MB/s", "drains", "drain p50/p99 ms",
+            "latency p50/p99 ms", "view"))
+    try:
+        for name in names:
+            result = scenarios[name]().run(sublime, sublimerepl, args.timeout)
+            if args.json:
+                print(json.dumps(result))
+                continue
+            print("%-10s %9.2f %10.1f %11.1f %7d %8.2f /%8.2f %8.2f /%8.2f %10d%s" % (
+                result["scenario"], result["seconds"], result["bytes"] / 1048576.0,
+                result["throughput"] / 1048576.0, result["drains"],
+                result["drain_p50"] * 1000, result["drain_p99"] * 1000,
+                result["latency_p50"] * 1000, result["latency_p99"] * 1000,
+                result["view_size"], "" if result["finished"] else " (timeout)"))
+    finally:
+        if cat_file:
+            os.remove(cat_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Checks history navigation against plain list matching and times it.
+
+   Run from the package directory:
+
+       python -m benchmarks.history [--entries N]
+
+   Both ways HistoryMatchList walks matches (precomputed positions and
+   scanning from the cursor) have to move exactly like a list of all
+   matching commands did."""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import sys
+import time
+import random
+import argparse
+
+from . import load_plugin
+
+
+class ListMatch(object):
+    """History matching as it was before the prefix index"""
+
+    def __init__(self, command_prefix, commands):
+        self._commands = [cmd for cmd in commands if cmd.startswith(command_prefix)]
+        self._cur = len(self._commands)  # no '-1' on purpose
+
+    def current_command(self):
+        return "" if not self._commands else self._commands[self._cur]
+
+    def prev_command(self):
+        self._cur = max(0, self._cur - 1)
+        return self.current_command()
+
+    def next_command(self):
+        self._cur = min(len(self._commands) - 1, self._cur + 1)
+        return self.current_command()
+
+
+def check(sublimerepl, commands, prefixes, moves):
+    """Returns a description of the first difference from ListMatch or None"""
+    history = sublimerepl.MemHistory()
+    for cmd in commands:
+        history.append(cmd)
+    materialize_max = sublimerepl.MATERIALIZE_MAX
+    try:
+        # MATERIALIZE_MAX of -1 makes every match scan lazily
+        for limit in (materialize_max, -1):
+            sublimerepl.MATERIALIZE_MAX = limit
+            for prefix in prefixes:
+                for sequence in moves:
+                    expected = ListMatch(prefix, commands)
+                    got = history.match(prefix)
+                    for step, move in enumerate(sequence):
+                        want = getattr(expected, move)()
+                        have = getattr(got, move)()
+                        if want != have:
+                            path = "lazy" if got._positions is None else "positions"
+                            return "%s path, prefix %r, moves %s: step %d gave %r, expected %r" % (
+                                path, prefix, sequence, step, have, want)
+    finally:
+        sublimerepl.MATERIALIZE_MAX = materialize_max
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.history", description=__doc__)
+    parser.add_argument("--entries", type=int, default=300000, help="history size to time matching with")
+    args = parser.parse_args(argv)
+
+    sublime, sublimerepl = load_plugin()
+    rnd = random.Random(1)
+
+    problem = check(sublimerepl, ["a1", "b1", "a2", "b2"], ["", "a", "b", "c"],
+                    [["next_command"] * 3 + ["prev_command"] * 5,
+                     ["prev_command"] * 5 + ["next_command"] * 5])
+    words = ["import os", "import sys", "print(x)", "x = 1", "é ü", ""]
+    commands = [rnd.choice(words) + rnd.choice(["", "1", "2"]) for _ in range(2000)]
+    moves = [[rnd.choice(["prev_command", "next_command"]) for _ in range(50)] for _ in range(20)]
+    problem = problem or check(sublimerepl, commands, ["", "i", "import ", "x", "z", "é"], moves)
+    if problem:
+        print("history navigation differs:", problem)
+        sys.exit(1)
+    print("history navigation matches list matching")
+
+    history = sublimerepl.MemHistory()
+    start = time.time()
+    history.set_commands(["cmd %d %s" % (i, rnd.choice(words)) for i in range(args.entries)])
+    print("index of %d entries built in %.1f ms" % (args.entries, (time.time() - start) * 1000))
+    for prefix in ["", "cmd 1", "cmd 12345 ", "nothing"]:
+        start = time.time()
+        match = history.match(prefix)
+        for _ in range(10):
+            match.prev_command()
+        print("match %-14r + 10 moves: %.2f ms" % (prefix, (time.time() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""Minimal stand-in for Sublime Text's sublime module. Views are plain
+   in-memory text buffers and set_timeout callbacks run from run_until(),
+   which has to be called from the thread that plays the UI thread."""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+DRAW_EMPTY = 1
+HIDE_ON_MINIMAP = 2
+DRAW_EMPTY_AS_OVERWRITE = 4
+DRAW_OUTLINED = 16
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+DRAW_SOLID_UNDERLINE = 512
+
+_packages_path = tempfile.mkdtemp(prefix="sublimerepl-bench-")
+_settings = {}
+_timers = []
+_timer_ids = itertools.count()
+_timers_changed = threading.Condition()
+
+
+def version():
+    return "3211"
+
+
+def platform():
+    return "windows" if os.name == "nt" else "linux"
+
+
+def packages_path():
+    return _packages_path
+
+
+def installed_packages_path():
+    return _packages_path
+
+
+def set_timeout(callback, delay=0):
+    with _timers_changed:
+        heapq.heappush(_timers, (time.time() + delay / 1000.0, next(_timer_ids), callback))
+        _timers_changed.notify()
+
+
+set_timeout_async = set_timeout
+
+
+def run_until(predicate, timeout):
+    """Runs timers until predicate() is true, returns False on timeout"""
+    deadline = time.time() + timeout
+    while not predicate():
+        with _timers_changed:
+            now = time.time()
+            if now >= deadline:
+                return False
+            if not _timers or _timers[0][0] > now:
+                wait = deadline - now
+                if _timers:
+                    wait = min(wait, _timers[0][0] - now)
+                _timers_changed.wait(wait)
+                continue
+            callback = heapq.heappop(_timers)[2]
+        callback()
+    return True
+
+
+def error_message(msg):
+    print("error_message:", msg)
+
+
+def message_dialog(msg):
+    print("message_dialog:", msg)
+
+
+def ok_cancel_dialog(msg, ok_title=""):
+    return True
+
+
+def status_message(msg):
+    pass
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def has(self, key):
+        return key in self._values
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+    def update(self, values):
+        self._values.update(values)
+
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+    return _settings[name]
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return "Region(%d, %d)" % (self.a, self.b)
+
+
+class Selection(list):
+    def add(self, region):
+        self.append(region)
+
+
+def _after_insert(pos, length):
+    """Text inserted at the end of a region is not part of it"""
+    def move(region):
+        begin, end = region.begin(), region.end()
+        if begin >= pos:
+            begin += length
+        if end > pos or (end == pos and end < begin):
+            end += length
+        return Region(begin, max(begin, end))
+    return move
+
+
+def _after_erase(begin, end):
+    def move_point(point):
+        if point <= begin:
+            return point
+        if point >= end:
+            return point - (end - begin)
+        return begin
+
+    def move(region):
+        return Region(move_point(region.a), move_point(region.b))
+    return move
+
+
+class View(object):
+    _ids = itertools.count(1)
+
+    def __init__(self, window=None):
+        self._id = next(View._ids)
+        self._window = window
+        self._text = ""
+        self._settings = Settings()
+        self._sel = Selection([Region(0)])
+        self._regions = {}
+        self._status = {}
+        self._read_only = False
+        self._name = ""
+
+    def id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def settings(self):
+        return self._settings
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def sel(self):
+        return self._sel
+
+    def is_read_only(self):
+        return self._read_only
+
+    def set_read_only(self, value):
+        self._read_only = value
+
+    def set_scratch(self, value):
+        pass
+
+    def set_name(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def set_syntax_file(self, syntax):
+        pass
+
+    def file_name(self):
+        return None
+
+    def show(self, x, show_surrounds=True):
+        pass
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, "")
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def scope_name(self, point):
+        return "source.python "
+
+    def _move_regions(self, move, pos):
+        """Applies move() to selection and regions that end at or after pos.
+           Regions are kept sorted, so the ones before pos are left alone"""
+        self._sel = Selection(move(r) for r in self._sel)
+        for regions, scope, flags in self._regions.values():
+            i = len(regions) - 1
+            while i >= 0 and regions[i].end() >= pos:
+                regions[i] = move(regions[i])
+                i -= 1
+
+    def insert(self, edit, pos, text):
+        self._text = self._text[:pos] + text + self._text[pos:]
+        self._move_regions(_after_insert(pos, len(text)), pos)
+        return len(text)
+
+    def erase(self, edit, region):
+        begin, end = region.begin(), region.end()
+        self._text = self._text[:begin] + self._text[end:]
+        self._move_regions(_after_erase(begin, end), begin)
+
+    def replace(self, edit, region, text):
+        self.erase(edit, region)
+        self.insert(edit, region.begin(), text)
+
+    def rowcol(self, point):
+        row = self._text.count("\n", 0, point)
+        return row, point - (self._text.rfind("\n", 0, point) + 1)
+
+    def text_point(self, row, col):
+        pos = 0
+        for _ in range(row):
+            newline = self._text.find("\n", pos)
+            if newline < 0:
+                return len(self._text)
+            pos = newline + 1
+        return pos + col
+
+    def line(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        begin = self._text.rfind("\n", 0, point) + 1
+        end = self._text.find("\n", point)
+        return Region(begin, len(self._text) if end < 0 else end)
+
+    def full_line(self, x):
+        line = self.line(x)
+        return Region(line.a, min(len(self._text), line.b + 1))
+
+    def add_regions(self, key, regions, scope="", icon="", flags=0):
+        self._regions[key] = (sorted(regions, key=Region.begin), scope, flags)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, ([], "", 0))[0])
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def run_command(self, cmd, args=None):
+        import sublime_plugin
+        sublime_plugin.run_text_command(self, cmd, args or {})
+
+
+class Window(object):
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self._id = next(Window._ids)
+        self._views = []
+        self._panels = {}
+        self.opened_files = []
+
+    def id(self):
+        return self._id
+
+    def new_file(self):
+        view = View(self)
+        self._views.append(view)
+        return view
+
+    def open_file(self, path, flags=0):
+        self.opened_files.append(path)
+        return self.new_file()
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._views[-1] if self._views else None
+
+    def active_group(self):
+        return 0
+
+    def num_groups(self):
+        return 1
+
+    def views_in_group(self, group):
+        return list(self._views)
+
+    def get_view_index(self, view):
+        return 0, self._views.index(view)
+
+    def set_view_index(self, view, group, index):
+        pass
+
+    def focus_view(self, view):
+        pass
+
+    def folders(self):
+        return []
+
+    def create_output_panel(self, name):
+        self._panels[name] = View(self)
+        return self._panels[name]
+
+    get_output_panel = create_output_panel
+
+    def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+        pass
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        return View(self)
+
+    def run_command(self, cmd, args=None):
+        import sublime_plugin
+        sublime_plugin.run_window_command(self, cmd, args or {})
+
+
+_windows = [Window()]
+
+
+def active_window():
+    return _windows[0]
+
+
+def windows():
+    return list(_windows)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Minimal stand-in for Sublime Text's sublime_plugin module"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import re
+
+
+class TextCommand(object):
+    def __init__(self, view):
+        self.view = view
+
+
+class WindowCommand(object):
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+def command_name(cls):
+    name = cls.__name__
+    if name.endswith("Command"):
+        name = name[:-len("Command")]
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+
+def _find_command(base, name):
+    todo = [base]
+    while todo:
+        cls = todo.pop()
+        if cls is not base and command_name(cls) == name:
+            return cls
+        todo.extend(cls.__subclasses__())
+    return None
+
+
+def run_text_command(view, name, args):
+    if name == "insert":
+        for region in view.sel():
+            view.insert(None, region.begin(), args["characters"])
+        return
+    cls = _find_command(TextCommand, name)
+    if cls is not None:
+        cls(view).run(None, **args)
+
+
+def run_window_command(window, name, args):
+    cls = _find_command(WindowCommand, name)
+    if cls is not None:
+        cls(window).run(**args)
+    elif window.active_view() is not None:
+        run_text_command(window.active_view(), name, args)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011, Wojciech Bederski (wuub.net)
+# All rights reserved.
+# See LICENSE.txt for details.
+"""Incremental fuzzy matching, used to search REPL history"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import re
+
+
+def pattern(query):
+    """Regex finding query's characters in order, each one at its first
+       occurrence after the previous one. Never backtracks, so it stays
+       linear in the length of searched text"""
+    parts = [re.escape(query[0])]
+    for char in query[1:]:
+        char = re.escape(char)
+        parts.append("[^%s]*%s" % (char, char))
+    return re.compile("".join(parts))
+
+
+class FuzzySearch(object):
+    """Ranks commands by how well they match a query whose characters have
+       to appear in them in order, ignoring case. commands are expected newest
+       first, of two equally good matches the newer one wins.
+
+       Candidates of every query typed so far are kept, so typing another
+       character only filters the previous candidates and deleting one goes
+       back to candidates already known"""
+
+    def __init__(self, commands):
+        self._commands = commands
+        self._lowered = [command.lower() for command in commands]
+        self._levels = [("", list(range(len(commands))))]  # (query, candidates)
+        self._ranked = {}  # query -> ranked candidates
+
+    def search(self, query, limit=None):
+        """Returns up to limit commands matching query, best first"""
+        query = query.lower()
+        ranked = self._ranked.get(query)
+        if ranked is None:
+            ranked = self._ranked[query] = self._rank(query, self._candidates(query))
+        return [self._commands[i] for i in ranked[:limit]]
+
+    def _candidates(self, query):
+        levels = self._levels
+        while not query.startswith(levels[-1][0]):
+            dropped = levels.pop()[0]
+            self._ranked.pop(dropped, None)
+        known, candidates = levels[-1]
+        if query != known:
+            lowered = self._lowered
+            if len(query) == 1:
+                candidates = [i for i in candidates if query in lowered[i]]
+            else:
+                search = pattern(query).search
+                candidates = [i for i in candidates if search(lowered[i])]
+            levels.append((query, candidates))
+        return candidates
+
+    def _rank(self, query, candidates):
+        if not query:
+            return candidates
+        lowered = self._lowered
+        search = pattern(query).search
+
+        def score(i):
+            command = lowered[i]
+            pos = command.find(query)
+            if pos == 0:
+                return 0
+            if pos > 0:
+                # whole query at the start of a word beats the middle of one
+                return 1 if not command[pos - 1].isalnum() else 2
+            # then the closer together the characters are, the better
+            match = search(command)
+            return 3 + match.end() - match.start()
+        # sort is stable, so recency breaks ties
+        return sorted(candidates, key=score)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011, Wojciech Bederski (wuub.net)
+# All rights reserved.
+# See LICENSE.txt for details.
+"""Append-only storage of REPL command history.
+
+Every entry is a record of a 4 byte big-endian length followed by that many
+bytes of UTF-8 JSON [timestamp, command], so adding an entry is a single
+small write. Compaction rewrites the file in the background without losing
+entries appended meanwhile and can drop old and repeated ones on the way."""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import io
+import os
+import json
+import time
+import struct
+import threading
+
+HEADER = struct.Struct(">I")
+
+# anything claiming to be longer than this is garbage, not a command
+MAX_RECORD = 16 * 1024 * 1024
+
+
+def encode(ts, command):
+    payload = json.dumps([ts, command]).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode(data):
+    """Returns ([(ts, command), ...], size of the valid part of data). A
+       record cut short by a crash ends the valid part"""
+    entries = []
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        (length,) = HEADER.unpack_from(data, pos)
+        end = pos + HEADER.size + length
+        if length > MAX_RECORD or end > len(data):
+            break
+        try:
+            ts, command = json.loads(data[pos + HEADER.size:end].decode("utf-8"))
+        except (ValueError, TypeError):
+            break
+        entries.append((ts, command))
+        pos = end
+    return entries, pos
+
+
+def bounded(entries, max_entries=None, max_age=None, unique=False, now=None):
+    """Returns entries without the ones older than max_age seconds, without
+       earlier occurrences of repeated commands if unique and then only
+       max_entries newest ones. Order of entries is kept"""
+    if max_age:
+        cutoff = (time.time() if now is None else now) - max_age
+        entries = [entry for entry in entries if entry[0] >= cutoff]
+    if unique:
+        seen = set()
+        kept = []
+        for entry in reversed(entries):
+            if entry[1] not in seen:
+                seen.add(entry[1])
+                kept.append(entry)
+        kept.reverse()
+        entries = kept
+    if max_entries and len(entries) > max_entries:
+        entries = entries[-max_entries:]
+    return entries
+
+
+def _replace(src, dst):
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        # python 2 can't rename over an existing file on windows
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class HistoryLog(object):
+    """History file of one REPL type. Use HistoryLog.get(), so that every
+       view of the same REPL writes through the same object"""
+
+    _logs = {}
+    _logs_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path):
+        with cls._logs_lock:
+            log = cls._logs.get(path)
+            if log is None:
+                log = cls._logs[path] = cls(path)
+            return log
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._fd = None
+
+    def load(self):
+        """Returns every (ts, command) in the log, oldest first"""
+        with self._lock:
+            data = self._read()
+            entries, valid = decode(data)
+            if valid < len(data):
+                # torn write at the end, later appends must not follow it
+                self._close()
+                with io.open(self.path, "r+b") as f:
+                    f.truncate(valid)
+        return entries
+
+    def append(self, ts, command):
+        record = encode(ts, command)
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND |
+                                   getattr(os, "O_BINARY", 0), 0o644)
+            os.write(self._fd, record)
+
+    def write(self, entries):
+        """Replaces the whole log with entries"""
+        tmp = self.path + ".tmp"
+        with io.open(tmp, "wb") as f:
+            f.write(b"".join(encode(ts, command) for ts, command in entries))
+        with self._lock:
+            self._close()
+            _replace(tmp, self.path)
+
+    def compact(self, keep=None):
+        """Rewrites the log in a background thread. keep(entries) returns
+           entries that should stay, by default all of them"""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        thread = threading.Thread(target=self._compact, args=(keep,))
+        thread.daemon = True
+        thread.start()
+
+    def _compact(self, keep):
+        tmp = self.path + ".tmp"
+        try:
+            with self._lock:
+                data = self._read()
+            entries, valid = decode(data)
+            if keep is not None:
+                entries = keep(entries)
+            with io.open(tmp, "wb") as f:
+                f.write(b"".join(encode(ts, command) for ts, command in entries))
+                with self._lock:
+                    # whatever got appended while we were busy goes along
+                    f.write(self._read()[valid:])
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._close()
+                    _replace(tmp, self.path)
+        except (IOError, OSError):
+            import traceback
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _read(self):
+        try:
+            with io.open(self.path, "rb") as f:
+                return f.read()
+        except (IOError, OSError):
+            return b""
+
+    def _close(self):
+        """Next append opens the file again, it may be a new one by then"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011, Wojciech Bederski (wuub.net)
+# All rights reserved.
+# See LICENSE.txt for details.
+"""CPU, memory and file descriptor usage of process trees, read from /proc"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import os
+import time
+
+PROC = "/proc"
+
+
+def available():
+    return os.path.isdir(os.path.join(PROC, "self"))
+
+
+def _stat(pid):
+    """Returns fields of /proc/<pid>/stat following the command name"""
+    with open(os.path.join(PROC, str(pid), "stat"), "rb") as f:
+        data = f.read()
+    # command name is in parens and may contain anything, even ") "
+    return data[data.rindex(b")") + 2:].split()
+
+
+def children_map():
+    """Returns {ppid: [pid, ...]} of every process on the system"""
+    children = {}
+    for name in os.listdir(PROC):
+        if not name.isdigit():
+            continue
+        try:
+            ppid = int(_stat(name)[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue  # gone in the meantime
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def process_tree(pid, children=None):
+    """Returns pid and pids of all its descendants"""
+    if children is None:
+        children = children_map()
+    tree = []
+    todo = [pid]
+    while todo:
+        cur = todo.pop()
+        tree.append(cur)
+        todo.extend(children.get(cur, ()))
+    return tree
+
+
+class Usage(object):
+    def __init__(self, processes=0, cpu=0.0, rss=0, fds=0):
+        self.processes = processes
+        self.cpu = cpu  # percent of one core
+        self.rss = rss  # bytes
+        self.fds = fds
+
+
+class TreeMonitor(object):
+    """Samples usage of a process and its descendants. CPU usage is
+       averaged over the time between two calls to sample()"""
+
+    TICKS = os.sysconf(str("SC_CLK_TCK")) if hasattr(os, "sysconf") else 100
+    PAGE_SIZE = os.sysconf(str("SC_PAGE_SIZE")) if hasattr(os, "sysconf") else 4096
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._ticks = {}  # pid -> utime + stime at the previous sample
+        self._time = None
+
+    def sample(self, children=None):
+        """Returns Usage or None if the process is gone"""
+        now = time.time()
+        ticks = {}
+        usage = Usage()
+        for pid in process_tree(self.pid, children):
+            try:
+                fields = _stat(pid)
+                ticks[pid] = int(fields[11]) + int(fields[12])
+                usage.rss += int(fields[21]) * self.PAGE_SIZE
+            except (IOError, OSError, IndexError, ValueError):
+                continue
+            usage.processes += 1
+            try:
+                usage.fds += len(os.listdir(os.path.join(PROC, str(pid), "fd")))
+            except OSError:
+                pass  # not ours to look at
+        if not usage.processes:
+            return None
+        if self._time is not None and now > self._time:
+            # processes that exited since the last sample don't count
+            used = sum(t - self._ticks.get(pid, t) for pid, t in ticks.items())
+            usage.cpu = max(0, 100.0 * used / self.TICKS / (now - self._time))
+        self._ticks = ticks
+        self._time = now
+        return usage
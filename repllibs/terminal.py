@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011, Wojciech Bederski (wuub.net)
+# All rights reserved.
+# See LICENSE.txt for details.
+"""Incremental processing of terminal output (escape sequences etc.)"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import re
+from bisect import bisect_right
+
+COLORS = ("black", "red", "green", "yellow", "blue", "magenta", "cyan", "white")
+
+# complete CSI, OSC and two character escape sequences, and char + backspace
+ESCAPE_RE = re.compile(
+    r'\x1b\[([0-9;:?]*)[ -/]*([@-~])'
+    r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
+    r'|\x1b[ -/]*[0-Z\\^-~]'
+    r'|[^\x08\n]?\x08')
+
+# sequences that were cut off at the end of a chunk
+PARTIAL_ESCAPE_RE = re.compile(
+    r'\x1b(?:\[[0-9;:?]*[ -/]*|\][^\x07\x1b]*\x1b?|[ -/]*)\Z')
+
+# partial sequence longer than this is not a sequence, just garbage
+MAX_PENDING = 256
+
+
+class AnsiParser(object):
+    """Strips escape sequences from a stream of text and reports the
+       foreground color of what's left. Sequences split between chunks
+       are carried over to the next feed()"""
+
+    def __init__(self):
+        self.color = None
+        self._pending = ""
+
+    def feed(self, text):
+        """Returns (plain_text, spans), spans is a list of (begin, end, color)
+           tuples with offsets into plain_text"""
+        if self._pending:
+            text = self._pending + text
+            self._pending = ""
+
+        if "\x1b" not in text and "\x08" not in text:
+            if self.color and text:
+                return text, [(0, len(text), self.color)]
+            return text, []
+
+        partial = PARTIAL_ESCAPE_RE.search(text)
+        if partial and len(text) - partial.start() <= MAX_PENDING:
+            self._pending = text[partial.start():]
+            text = text[:partial.start()]
+
+        parts = []
+        spans = []
+        length = 0
+        span_start = 0
+        pos = 0
+        for match in ESCAPE_RE.finditer(text):
+            if match.start() > pos:
+                parts.append(text[pos:match.start()])
+                length += match.start() - pos
+            pos = match.end()
+            if match.group(2) != "m":
+                continue  # cursor movement, titles etc. are dropped
+            color = self._sgr(match.group(1))
+            if color != self.color:
+                if self.color and length > span_start:
+                    spans.append((span_start, length, self.color))
+                self.color = color
+                span_start = length
+        if pos < len(text):
+            parts.append(text[pos:])
+            length += len(text) - pos
+        if self.color and length > span_start:
+            spans.append((span_start, length, self.color))
+        return "".join(parts), spans
+
+    def _sgr(self, params):
+        """Returns foreground color after applying Select Graphic Rendition"""
+        color = self.color
+        codes = [int(p) if p.isdigit() else 0 for p in params.replace(":", ";").split(";")]
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            if code == 0 or code == 39:
+                color = None
+            elif 30 <= code <= 37:
+                color = COLORS[code - 30]
+            elif 90 <= code <= 97:
+                color = COLORS[code - 90]
+            elif code in (38, 48):
+                # extended colors, only the basic 16 have a name
+                if i + 2 < len(codes) and codes[i + 1] == 5:
+                    if code == 38:
+                        n = codes[i + 2]
+                        color = COLORS[n % 8] if n < 16 else None
+                    i += 2
+                elif i + 1 < len(codes) and codes[i + 1] == 2:
+                    if code == 38:
+                        color = None
+                    i += 4
+            i += 1
+        return color
+
+
+# a line up to its last lone \r (one not followed by \n), or the \r of \r\n
+CARRIAGE_RETURN_RE = re.compile(r'(?m)(^[^\n]*\r(?!\n))|\r(?=\n)')
+
+
+class CarriageReturnFilter(object):
+    """Collapses lines redrawn with \\r (progress bars etc.): text after
+       the last \\r in a line replaces whatever came before it"""
+
+    def __init__(self):
+        self._pending_cr = False
+
+    def feed(self, text, spans):
+        """Returns (text, spans, overwrite). When overwrite is true, the first
+           line of text replaces the line left unfinished by previous output"""
+        if self._pending_cr:
+            # \r at the end of the last chunk, it may have been half of \r\n
+            text = "\r" + text
+            spans = [(begin + 1, end + 1, color) for (begin, end, color) in spans]
+            self._pending_cr = False
+        if "\r" not in text:
+            return text, spans, False
+        if text.endswith("\r"):
+            text = text[:-1]
+            self._pending_cr = True
+
+        removed = []
+        overwrite = False
+        for match in CARRIAGE_RETURN_RE.finditer(text):
+            if match.group(1) is not None and match.start() == 0:
+                overwrite = True
+            removed.append((match.start(), match.end()))
+        if not removed:
+            return text, spans, overwrite
+
+        parts = []
+        pos = 0
+        for start, end in removed:
+            parts.append(text[pos:start])
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts), self._remap(spans, removed), overwrite
+
+    def _remap(self, spans, removed):
+        starts = [start for (start, end) in removed]
+        removed_before = [0]
+        for start, end in removed:
+            removed_before.append(removed_before[-1] + end - start)
+
+        def remap(offset):
+            i = bisect_right(starts, offset) - 1
+            if i < 0:
+                return offset
+            start, end = removed[i]
+            if offset < end:
+                return start - removed_before[i]
+            return offset - removed_before[i + 1]
+
+        remapped = []
+        for begin, end, color in spans:
+            begin, end = remap(begin), remap(end)
+            if begin < end:
+                remapped.append((begin, end, color))
+        return remapped
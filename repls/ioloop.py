@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011, Wojciech Bederski (wuub.net)
+# All rights reserved.
+# See LICENSE.txt for details.
+"""One thread that waits for output of every REPL that has a file descriptor,
+   instead of a blocked reader thread per REPL"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import os
+import sys
+import time
+import errno
+import select
+import threading
+import traceback
+
+if os.name == 'posix':
+    import fcntl
+
+
+def _retry_eintr(call, *args):
+    """Python before 3.5 doesn't restart calls interrupted by signals"""
+    while True:
+        try:
+            return call(*args)
+        except (OSError, IOError, select.error) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+
+class EpollPoller(object):
+    """Waits for fds to become readable. Just what IOLoop needs of the
+       selectors module, which the plugin host (Python 3.3) doesn't have.
+       register() raises KeyError for an fd that is already registered"""
+
+    def __init__(self):
+        self._fds = set()
+        self._epoll = select.epoll()
+
+    def register(self, fd):
+        if fd in self._fds:
+            raise KeyError(fd)
+        self._epoll.register(fd, select.EPOLLIN)
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.remove(fd)
+        self._epoll.unregister(fd)  # fails if fd got closed, epoll forgot it by then
+
+    def poll(self, timeout=None):
+        """Returns fds ready for reading, or that hung up or failed"""
+        events = _retry_eintr(self._epoll.poll, -1 if timeout is None else timeout)
+        return [fd for fd, mask in events]
+
+
+class PollPoller(EpollPoller):
+    def __init__(self):
+        self._fds = set()
+        self._poll = select.poll()
+
+    def register(self, fd):
+        if fd in self._fds:
+            raise KeyError(fd)
+        self._poll.register(fd, select.POLLIN | select.POLLPRI)
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.remove(fd)
+        self._poll.unregister(fd)
+
+    def poll(self, timeout=None):
+        events = _retry_eintr(self._poll.poll, None if timeout is None else timeout * 1000)
+        return [fd for fd, mask in events]
+
+
+class SelectPoller(EpollPoller):
+    def __init__(self):
+        self._fds = set()
+
+    def register(self, fd):
+        if fd in self._fds:
+            raise KeyError(fd)
+        os.fstat(fd)  # fail now for a closed fd, like the others do
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.remove(fd)
+
+    def poll(self, timeout=None):
+        fds = list(self._fds)
+        try:
+            return _retry_eintr(select.select, fds, [], [], timeout)[0]
+        except (OSError, IOError, select.error, ValueError):
+            # an fd got closed, its callback gets to find out
+            return [fd for fd in fds if not self._valid(fd)]
+
+    @staticmethod
+    def _valid(fd):
+        try:
+            os.fstat(fd)
+            return True
+        except OSError:
+            return False
+
+
+def default_poller():
+    if hasattr(select, "epoll"):
+        return EpollPoller()
+    if hasattr(select, "poll") and sys.platform != "darwin":
+        return PollPoller()  # OSX poll() doesn't work with ttys
+    return SelectPoller()
+
+
+class IOLoop(threading.Thread):
+    """Calls callback() from this thread whenever its fd becomes readable.
+       A callback returning False is unregistered. All methods can be called
+       from any thread"""
+
+    def __init__(self):
+        super(IOLoop, self).__init__(name="SublimeREPL IOLoop")
+        self.daemon = True
+        self._poller = default_poller()
+        self._callbacks = {}  # fd -> callback
+        self._paused = {}  # fd -> time to resume at or None
+        self._changes = []
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._poller.register(self._wake_r)
+
+    def register(self, fd, callback):
+        self._change("register", fd, callback)
+
+    def unregister(self, fd):
+        self._change("unregister", fd)
+
+    def pause(self, fd, delay=None):
+        """Stops watching fd for delay seconds or until resume()"""
+        self._change("pause", fd, delay)
+
+    def resume(self, fd):
+        self._change("resume", fd)
+
+    def _change(self, *change):
+        with self._lock:
+            self._changes.append(change)
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass  # pipe is full, loop is going to wake up anyway
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for change in changes:
+            action, fd = change[0], change[1]
+            if action == "register":
+                self._callbacks[fd] = change[2]
+                self._watch(fd)
+            elif action == "unregister":
+                self._remove(fd)
+            elif action == "pause" and fd in self._callbacks:
+                delay = change[2]
+                self._paused[fd] = time.time() + delay if delay is not None else None
+                self._unwatch(fd)
+            elif action == "resume" and fd in self._paused:
+                del self._paused[fd]
+                self._watch(fd)
+
+    def _watch(self, fd):
+        try:
+            self._poller.register(fd)
+        except KeyError:
+            pass  # already registered
+        except (OSError, IOError, ValueError):
+            self._remove(fd)  # closed in the meantime
+
+    def _unwatch(self, fd):
+        try:
+            self._poller.unregister(fd)
+        except (KeyError, OSError, IOError, ValueError):
+            pass
+
+    def _remove(self, fd):
+        self._unwatch(fd)
+        self._callbacks.pop(fd, None)
+        self._paused.pop(fd, None)
+
+    def _timeout(self):
+        """Seconds until the first paused fd is due to be resumed"""
+        due = [t for t in self._paused.values() if t is not None]
+        if not due:
+            return None
+        return max(0, min(due) - time.time())
+
+    def _resume_due(self):
+        now = time.time()
+        for fd, t in list(self._paused.items()):
+            if t is not None and t <= now:
+                del self._paused[fd]
+                self._watch(fd)
+
+    def run(self):
+        while True:
+            self._apply_changes()
+            ready = self._poller.poll(self._timeout())
+            if self._wake_r in ready:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except OSError:
+                    pass
+                # a pause requested meanwhile applies to fds ready now
+                self._apply_changes()
+            for fd in ready:
+                if fd == self._wake_r:
+                    continue
+                if fd not in self._callbacks or fd in self._paused:
+                    continue  # paused by a callback called before this one
+                try:
+                    keep = self._callbacks[fd]()
+                except Exception:
+                    traceback.print_exc()
+                    keep = False
+                if not keep:
+                    self._remove(fd)
+            self._resume_due()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def available():
+    return os.name == 'posix'
+
+
+def instance():
+    """Returns the shared IOLoop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = IOLoop()
+            _loop.start()
+        return _loop
@@ -1,3 +1,3 @@
-from .killableprocess import Popen, mswindows
+from .killableprocess import Popen, mswindows, setpgid_preexec_fn
 if mswindows:
 	from .winprocess import STARTUPINFO, STARTF_USESHOWWINDOW
\ No newline at end of file
@@ -235,7 +235,7 @@ class Popen(subprocess.Popen):
             # timeout is now in milliseconds
             timeout = timeout * 1000
 
-        if self.returncode is not None:
+        if self.returncode is not None and (mswindows or not group):
             return self.returncode
 
         starttime = datetime.datetime.now()
@@ -266,13 +266,19 @@ class Popen(subprocess.Popen):
             else:
                 self.returncode = winprocess.GetExitCodeProcess(self._handle)
         else:
-            if (sys.platform == 'linux2') or (sys.platform in ('sunos5', 'solaris')):
+            if sys.platform.startswith('linux') or (sys.platform in ('sunos5', 'solaris')):
                 def group_wait(timeout):
-                    try:
-                        os.waitpid(self.pid, 0)
-                    except OSError as e:
-                        pass # If wait has already been called on this pid, bad things happen
-                    return self.returncode
+                    # until the process and every other member of its group is gone
+                    while True:
+                        self.poll()
+                        try:
+                            os.killpg(self.pid, 0)
+                        except OSError:
+                            return self.returncode
+                        diff = datetime.datetime.now() - starttime
+                        if timeout is not None and (diff.seconds * 1000 * 1000 + diff.microseconds) >= (timeout * 1000):
+                            return self.returncode
+                        time.sleep(.05)
             elif sys.platform == 'darwin':
                 def group_wait(timeout):
                     try:
@@ -304,7 +310,7 @@ class Popen(subprocess.Popen):
                 if group is True:
                     return group_wait(timeout)
                 else:
-                    if subprocess.poll() is not None:
+                    if self.poll() is not None:
                         returncode = self.returncode
                 time.sleep(.5)
                 now = datetime.datetime.now()
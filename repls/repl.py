@@ -38,11 +38,15 @@ class Repl(object):
         self._encoding = encoding
         self.decoder = getincrementaldecoder(self._encoding)()
         self.encoder = getencoder(encoding)
+        self._stderr_decoder = None
         self.external_id = external_id
         self.cmd_postfix = cmd_postfix
         self.suppress_echo = suppress_echo
         self.additional_scopes = additional_scopes or []
         self.apiv2 = apiv2
+        # raw traffic counters, see ReplStats
+        self.bytes_read = 0
+        self.bytes_written = 0
 
     def autocomplete_available(self):
         return False
@@ -67,6 +71,15 @@ class Repl(object):
         """ Returns true if the undelying process is stil working"""
         raise NotImplementedError
 
+    def exit_reason(self):
+        """Returns description of why the repl died, if there is anything
+           more to say than that it's gone"""
+        return None
+
+    def pid(self):
+        """Returns id of the local process running this repl, if any"""
+        return None
+
     def write_bytes(self, bytes):
         raise NotImplementedError
 
@@ -75,6 +88,17 @@ class Repl(object):
            Can block!!!"""
         raise NotImplementedError
 
+    def fileno(self):
+        """Returns file descriptor that becomes readable when there is output
+           for read_available(), or None if this Repl has to be read with
+           (blocking) read() from its own thread"""
+        return None
+
+    def read_bytes_available(self):
+        """Reads Repl output that is ready without blocking. Returns None if
+           output died and b"" if there is nothing to read"""
+        raise NotImplementedError
+
     def kill(self):
         """Kills the underlying repl"""
         raise NotImplementedError
@@ -82,21 +106,71 @@ class Repl(object):
     def write(self, command):
         """Encodes and evaluates a given command"""
         (bytes, how_many) = self.encoder(command)
+        self.bytes_written += len(bytes)
         return self.write_bytes(bytes)
 
+    def pending_input(self):
+        """Returns number of bytes written but not yet delivered to the repl"""
+        return 0
+
+    def cancel_input(self):
+        """Discards undelivered input, returns number of bytes discarded"""
+        return 0
+
     def reset_decoder(self):
         self.decoder = getincrementaldecoder(self._encoding)()
 
+    def decode(self, bs, stderr=False):
+        self.bytes_read += len(bs)
+        if stderr:
+            # separate stream, multibyte chars may be split independently
+            if self._stderr_decoder is None:
+                self._stderr_decoder = getincrementaldecoder(self._encoding)()
+            decoder = self._stderr_decoder
+        else:
+            decoder = self.decoder
+        try:
+            return decoder.decode(bs)
+        except Exception as e:
+            if stderr:
+                self._stderr_decoder = None
+            else:
+                self.reset_decoder()
+            return "■"
+
     def read(self):
         """Reads at least one decoded char of output"""
         while True:
             bs = self.read_bytes()
             if not bs:
                 return None
-            try:
-                output = self.decoder.decode(bs)
-            except Exception as e:
-                output = "■"
-                self.reset_decoder()
+            output = self.decode(bs)
             if output:
                 return output
+
+    def stderr_fileno(self):
+        """Returns fd of error output when it's kept apart from the rest of
+           output, read with read_stderr_available()"""
+        return None
+
+    def read_stderr_bytes_available(self):
+        raise NotImplementedError
+
+    def read_stderr_available(self):
+        """Like read_available() for the separate error output"""
+        bs = self.read_stderr_bytes_available()
+        if bs is None:
+            return None
+        if not bs:
+            return ""
+        return self.decode(bs, stderr=True)
+
+    def read_available(self):
+        """Decodes output that is ready without blocking. Returns None if
+           output died and "" if there is nothing to return yet"""
+        bs = self.read_bytes_available()
+        if bs is None:
+            return None
+        if not bs:
+            return ""
+        return self.decode(bs)
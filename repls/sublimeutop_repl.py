@@ -29,6 +29,10 @@ class SublimeUTopRepl(SubprocessRepl):
     def autocomplete_available(self):
         return True
 
+    def fileno(self):
+        # output is parsed stanza by stanza in read()
+        return None
+
     def autocomplete_completions(self, whole_line, pos_in_line,
                                  prefix, whole_prefix, locations):
         self._completion_prefix = prefix
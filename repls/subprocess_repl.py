@@ -4,14 +4,24 @@
 # See LICENSE.txt for details.
 from __future__ import absolute_import, unicode_literals, print_function, division
 
+import io
+import atexit
 import subprocess
 import os
 import sys
+import time
+import errno
+import threading
 from .repl import Repl
 import signal
 from sublime import load_settings, error_message
 from .autocomplete_server import AutocompleteServer
-from .killableprocess import Popen
+from .killableprocess import Popen, setpgid_preexec_fn
+try:
+    from ..repllibs import procstat
+except (ImportError, ValueError):
+    from repllibs import procstat
+from collections import deque
 
 PY3 = sys.version_info[0] == 3
 
@@ -19,10 +29,168 @@ if os.name == 'posix':
     POSIX = True
     import fcntl
     import select
+    import pty
+    import termios
+    import resource
 else:
     POSIX = False
 
 
+# FdReader buffer size bounds
+READ_BUFFER_MIN = 4096
+READ_BUFFER_MAX = 1024 * 1024
+
+# Input is delivered by a writer thread in chunks of this size, so a
+# child that doesn't read its stdin can't block the editor
+WRITE_CHUNK = 16384
+
+# repls between kill() and the end of their shutdown sequence
+_shutting_down = set()
+
+
+@atexit.register
+def _kill_shutting_down():
+    """Editor is going away, don't leave anything behind"""
+    for repl in list(_shutting_down):
+        try:
+            repl.popen.kill(group=True)
+        except Exception:
+            pass
+
+
+# "limits" that are given in megabytes, the rest is passed to setrlimit as is
+RLIMITS_MB = ("as", "data", "rss", "stack", "memlock")
+
+# Environment of a login shell is expensive to get (rc files can take
+# seconds), so it's cached until one of these files changes or
+# getenv_cache_ttl seconds pass.
+RC_FILES = ("~/.profile", "~/.bashrc", "~/.bash_profile", "~/.zshrc")
+
+_env_cache = {}  # tuple(getenv_command) -> (env, rc files mtimes, time)
+_env_refreshing = set()
+_env_lock = threading.Lock()
+
+
+def rc_files_mtimes():
+    mtimes = []
+    for path in RC_FILES:
+        try:
+            mtimes.append(os.path.getmtime(os.path.expanduser(path)))
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def parse_env(output):
+    """Parses output of env, NUL separated (env -0) or one variable per line"""
+    text = output.decode("utf-8", errors="replace")
+    entries = text.split("\0") if "\0" in text else text.splitlines()
+    env = {}
+    for entry in entries:
+        if "=" not in entry:
+            continue
+        key, value = entry.split("=", 1)
+        # rc files may print something before env output
+        key = key.rsplit("\n", 1)[-1]
+        if key:
+            env[key] = value
+    return env
+
+
+def load_login_env(getenv_command):
+    mtimes = rc_files_mtimes()
+    env = parse_env(subprocess.check_output(getenv_command))
+    with _env_lock:
+        _env_cache[tuple(getenv_command)] = (env, mtimes, time.time())
+    return env
+
+
+def refresh_login_env_async(getenv_command):
+    """Reloads cached environment for getenv_command in a background thread"""
+    if not getenv_command or not POSIX:
+        return
+    key = tuple(getenv_command)
+    with _env_lock:
+        if key in _env_refreshing:
+            return
+        _env_refreshing.add(key)
+
+    def refresh():
+        try:
+            load_login_env(getenv_command)
+        except Exception:
+            pass  # getenv() will report it when it's actually needed
+        finally:
+            with _env_lock:
+                _env_refreshing.discard(key)
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
+
+
+def login_env(getenv_command, ttl=None):
+    """Returns copy of the (cached) environment printed by getenv_command"""
+    with _env_lock:
+        cached = _env_cache.get(tuple(getenv_command))
+    if cached is not None:
+        env, mtimes, loaded = cached
+        if mtimes == rc_files_mtimes():
+            if ttl and time.time() - loaded > ttl:
+                # still good enough for now, get a fresh one for next time
+                refresh_login_env_async(getenv_command)
+            return dict(env)
+    return dict(load_login_env(getenv_command))
+
+
+class FdReader(object):
+    """Non-blocking reads from a POSIX fd into a reusable buffer that
+       doubles while reads keep filling it up and shrinks back when
+       output calms down"""
+
+    def __init__(self, fd):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # unbuffered, reads go straight from the fd into the buffer
+        self._raw = io.FileIO(fd, "rb", closefd=False)
+        self._buffer = memoryview(bytearray(READ_BUFFER_MIN))
+
+    def read(self):
+        """Reads everything that's ready with as few syscalls as possible.
+           Returns None at EOF and b"" when nothing is ready. Returned
+           memoryview is only valid until the next call"""
+        buf = self._buffer
+        size = 0
+        while size < len(buf):
+            try:
+                n = self._raw.readinto(buf[size:])
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    n = None
+                elif size:
+                    break  # output died, reported on the next call
+                else:
+                    return None  # EIO from pty master once the child is gone
+            if n is None:
+                break
+            if n == 0:
+                if not size:
+                    return None
+                break
+            size += n
+            if size < len(buf):
+                break  # short read, nothing more is waiting
+        if size == len(buf) and len(buf) < READ_BUFFER_MAX:
+            self._buffer = memoryview(bytearray(2 * len(buf)))
+        elif size < len(buf) // 4 and len(buf) > READ_BUFFER_MIN:
+            self._buffer = memoryview(bytearray(len(buf) // 2))
+        if not size:
+            return b""
+        if not PY3:
+            return buf[:size].tobytes()
+        return buf[:size]
+
+
 class Unsupported(Exception):
     def __init__(self, msgs):
         super(Unsupported, self).__init__()
@@ -55,7 +223,7 @@ def win_find_executable(executable, env):
 class SubprocessRepl(Repl):
     TYPE = "subprocess"
 
-    def __init__(self, encoding, cmd=None, env=None, cwd=None, extend_env=None, soft_quit="", autocomplete_server=False, **kwds):
+    def __init__(self, encoding, cmd=None, env=None, cwd=None, extend_env=None, soft_quit="", autocomplete_server=False, pty=False, limits=None, separate_stderr=False, **kwds):
         super(SubprocessRepl, self).__init__(encoding, **kwds)
         settings = load_settings('SublimeREPL.sublime-settings')
 
@@ -80,20 +248,134 @@ class SubprocessRepl(Repl):
         self._cmd = self.cmd(cmd, env)
         self._soft_quit = soft_quit
         self._killed = False
-        self.popen = Popen(
-                        self._cmd,
-                        startupinfo=self.startupinfo(settings),
-                        creationflags=self.creationflags(settings),
-                        bufsize=1,
-                        cwd=self.cwd(cwd, settings),
-                        env=env,
-                        stderr=subprocess.STDOUT,
-                        stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE)
-
+        self._descendants = []
+        self._input = deque()
+        self._input_size = 0  # bytes queued or being written
+        self._input_line_open = False  # last chunk taken ended mid-line
+        self._input_lock = threading.Lock()
+        self._writer = None
+        self._limits = limits or {}
+        # error output gets its own pipe, read and styled separately
+        separate_stderr = separate_stderr and POSIX
+        stderr = subprocess.PIPE if separate_stderr else None
+        rlimits = self.rlimits(self._limits)
+        if PY3 and POSIX and not pty and rlimits == ([], 0):
+            # own session (and so process group) for kill(), set up without
+            # running python in the forked child, which isn't safe in
+            # a threaded process like the plugin host
+            spawn_kwds = {"start_new_session": True}
+        else:
+            spawn_kwds = {"preexec_fn": self.preexec_fn(pty, rlimits)}
+        # master side of the pseudo-terminal, None when talking over pipes
+        self._pty = None
+        if pty and POSIX:
+            master, slave = self.open_pty()
+            env.setdefault("TERM" if PY3 else b"TERM", "dumb" if PY3 else b"dumb")
+            try:
+                self.popen = Popen(
+                                self._cmd,
+                                cwd=self.cwd(cwd, settings),
+                                env=env,
+                                close_fds=True,
+                                stderr=stderr or slave,
+                                stdin=slave,
+                                stdout=slave,
+                                **spawn_kwds)
+            except:
+                os.close(master)
+                raise
+            finally:
+                os.close(slave)
+            self._pty = io.open(master, "rb", buffering=0)
+        else:
+            self.popen = Popen(
+                            self._cmd,
+                            startupinfo=self.startupinfo(settings),
+                            creationflags=self.creationflags(settings),
+                            bufsize=1,
+                            cwd=self.cwd(cwd, settings),
+                            env=env,
+                            stderr=stderr or subprocess.STDOUT,
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            **spawn_kwds)
+
+        self._stderr_reader = None
         if POSIX:
-            flags = fcntl.fcntl(self.popen.stdout, fcntl.F_GETFL)
-            fcntl.fcntl(self.popen.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self._stdout_reader = FdReader(self.fileno())
+            if separate_stderr:
+                self._stderr_reader = FdReader(self.popen.stderr.fileno())
+
+    def open_pty(self):
+        """Returns (master, slave) fds of a pseudo-terminal that doesn't echo
+           input back and doesn't turn \n into \r\n"""
+        master, slave = pty.openpty()
+        attrs = termios.tcgetattr(slave)
+        attrs[1] &= ~termios.ONLCR  # oflag
+        attrs[3] &= ~termios.ECHO  # lflag
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        return master, slave
+
+    def rlimits(self, limits):
+        """Returns [(resource, soft limit), ...] and nice increment for
+           "limits" like {"as": 2048, "cpu": 600, "nofile": 256, "nice": 10}"""
+        rlimits = []
+        nice = limits.get("nice", 0)
+        if not POSIX:
+            if limits:
+                print("SublimeREPL: limits are not supported on this platform")
+            return rlimits, 0
+        for name, value in sorted(limits.items()):
+            if name == "nice":
+                continue
+            res = getattr(resource, "RLIMIT_" + name.upper(), None)
+            if res is None:
+                raise ValueError("unknown limit %r" % (name,))
+            if name in RLIMITS_MB:
+                value = int(value * 1024 * 1024)
+            rlimits.append((res, int(value)))
+        return rlimits, nice
+
+    def preexec_fn(self, pty, rlimits):
+        """Returns function that sets the child up between fork and exec"""
+        rlimits, nice = rlimits
+        if not POSIX:
+            return None
+
+        def preexec():
+            if pty:
+                # pseudo-terminal becomes controlling terminal of the child,
+                # so it gets ^C etc. and believes it's interactive
+                os.setsid()
+                fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+            else:
+                # own process group, so kill() gets grandchildren too
+                setpgid_preexec_fn()
+            for res, value in rlimits:
+                soft, hard = resource.getrlimit(res)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)  # only root can raise it
+                resource.setrlimit(res, (value, hard))
+            if nice:
+                os.nice(nice)
+        return preexec
+
+    def exit_reason(self):
+        returncode = self.popen.poll()
+        if returncode is None or returncode >= 0:
+            return None
+        signum = -returncode
+        names = dict((getattr(signal, name), name) for name in dir(signal)
+                     if name.startswith("SIG") and not name.startswith("SIG_"))
+        reason = "killed by %s" % names.get(signum, "signal %d" % signum)
+        if signum == getattr(signal, "SIGXCPU", None) and "cpu" in self._limits:
+            reason += ", CPU time limit of %s s exceeded" % self._limits["cpu"]
+        elif signum in (signal.SIGSEGV, signal.SIGABRT, signal.SIGBUS) and (
+                "as" in self._limits or "data" in self._limits):
+            reason += ", probably by hitting its memory limit"
+        elif signum == getattr(signal, "SIGXFSZ", None):
+            reason += ", file size limit exceeded"
+        return reason
 
     def autocomplete_server_port(self):
         if not self._autocomplete_server:
@@ -141,10 +423,7 @@ class SubprocessRepl(Repl):
         getenv_command = settings.get("getenv_command")
         if getenv_command and POSIX:
             try:
-                output = subprocess.check_output(getenv_command)
-                lines = output.decode("utf-8", errors="replace").splitlines()
-                env = dict(line.split('=', 1)  for line in lines)
-                return env
+                return login_env(getenv_command, settings.get("getenv_cache_ttl"))
             except:
                 import traceback
                 traceback.print_exc()
@@ -208,13 +487,16 @@ class SubprocessRepl(Repl):
     def is_alive(self):
         return self.popen.poll() is None
 
+    def pid(self):
+        return self.popen.pid
+
     def read_bytes(self):
-        out = self.popen.stdout
         if POSIX:
             while True:
-                i, _, _ = select.select([out], [], [])
-                if i:
-                    return out.read(4096)
+                select.select([self.fileno()], [], [])
+                result = self.read_bytes_available()
+                if result != b"":
+                    return result
         else:
             # this is windows specific problem, that you cannot tell if there
             # are more bytes ready, so we read only 1 at a times
@@ -229,15 +511,162 @@ class SubprocessRepl(Repl):
 
 
 
+    def fileno(self):
+        if not POSIX:
+            return None
+        if self._pty is not None:
+            return self._pty.fileno()
+        return self.popen.stdout.fileno()
+
+    def read_bytes_available(self):
+        return self._stdout_reader.read()
+
+    def stderr_fileno(self):
+        if self._stderr_reader is None:
+            return None
+        return self.popen.stderr.fileno()
+
+    def read_stderr_bytes_available(self):
+        return self._stderr_reader.read()
+
     def write_bytes(self, bytes):
+        with self._input_lock:
+            self._input.append(memoryview(bytes))
+            self._input_size += len(bytes)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop)
+                self._writer.daemon = True
+                self._writer.start()
+
+    def pending_input(self):
+        return self._input_size
+
+    def cancel_input(self):
+        with self._input_lock:
+            keep = None
+            if self._input_line_open:
+                # finish the line that is half way to the repl already
+                parts = []
+                for bs in self._input:
+                    end = bs.tobytes().find(b"\n")
+                    if end >= 0:
+                        parts.append(bs[:end + 1].tobytes())
+                        keep = memoryview(b"".join(parts))
+                        break
+                    parts.append(bs.tobytes())
+            discarded = sum(len(bs) for bs in self._input)
+            self._input.clear()
+            if keep is not None:
+                self._input.append(keep)
+                discarded -= len(keep)
+            self._input_size -= discarded
+        return discarded
+
+    def _write_loop(self):
+        """Runs until the input queue is empty, write_bytes() starts it again"""
+        while True:
+            with self._input_lock:
+                if not self._input:
+                    self._writer = None
+                    return
+                chunk = self._input[0][:WRITE_CHUNK].tobytes()
+                self._input_line_open = not chunk.endswith(b"\n")
+                if len(chunk) == len(self._input[0]):
+                    self._input.popleft()
+                else:
+                    self._input[0] = self._input[0][WRITE_CHUNK:]
+            try:
+                self._write_now(chunk)
+            except (IOError, OSError, ValueError):
+                self.cancel_input()  # nobody is listening anymore
+            with self._input_lock:
+                self._input_size -= len(chunk)
+
+    def _write_now(self, bytes):
+        if self._pty is not None:
+            # master is non-blocking for the reader, wait until pty takes it all
+            fd = self._pty.fileno()
+            while bytes:
+                try:
+                    bytes = bytes[os.write(fd, bytes):]
+                except OSError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        raise
+                    select.select([], [fd], [])
+            return
         si = self.popen.stdin
         si.write(bytes)
         si.flush()
 
     def kill(self):
-        self._killed = True
+        self.cancel_input()
         self.write(self._soft_quit)
-        self.popen.kill()
+        self._killed = True
+        settings = load_settings('SublimeREPL.sublime-settings')
+        _shutting_down.add(self)
+        thread = threading.Thread(target=self.shutdown, args=(
+            settings.get("kill_soft_quit_timeout", 2) if self._soft_quit else 0,
+            settings.get("kill_terminate_timeout", 2)))
+        thread.daemon = True
+        thread.start()
+
+    def shutdown(self, soft_quit_timeout, terminate_timeout):
+        """Gives the repl soft_quit_timeout seconds to exit on its own, then
+           sends SIGTERM to its process group, and after terminate_timeout
+           seconds SIGKILL"""
+        try:
+            if not POSIX:
+                self.popen.wait(soft_quit_timeout or 0.1)  # kills the job after timeout
+                if self.popen.poll() is None:
+                    self.popen.kill()
+                return
+            # descendants that moved to process groups of their own (jobs of
+            # an interactive shell etc.) are remembered before they get orphaned
+            self._descendants = []
+            if procstat.available():
+                self._descendants = procstat.process_tree(self.popen.pid)[1:]
+            self.popen.wait(soft_quit_timeout, group=True)
+            if self.group_alive():
+                self.signal_group(signal.SIGTERM)
+                self.popen.wait(terminate_timeout, group=True)
+            if self.group_alive():
+                self.signal_group(signal.SIGKILL)
+                self.popen.kill(group=True)
+                try:
+                    os.waitpid(self.popen.pid, 0)  # kill() doesn't reap it
+                except OSError:
+                    pass
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            _shutting_down.discard(self)
+
+    def group_alive(self):
+        self.popen.poll()
+        try:
+            os.killpg(self.popen.pid, 0)
+            return True
+        except OSError:
+            pass
+        for pid in self._descendants:
+            try:
+                os.kill(pid, 0)
+                return True
+            except OSError:
+                pass
+        return False
+
+    def signal_group(self, sig):
+        try:
+            os.killpg(self.popen.pid, sig)
+        except OSError:
+            pass
+        for pid in self._descendants:
+            try:
+                os.kill(pid, sig)
+            except OSError:
+                pass
 
     def available_signals(self):
         signals = {}
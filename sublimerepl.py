@@ -4,29 +4,41 @@
 # See LICENSE.txt for details.
 from __future__ import absolute_import, unicode_literals, print_function, division
 
-import re
+import io
 import os
+import re
 import sys
+import json
 import os.path
+import time
+import select
 import threading
 import traceback
-from datetime import datetime
+from bisect import bisect_left, insort
+from collections import deque
 
 import sublime
 import sublime_plugin
 
 try:
-    import queue
     from . import sublimerepl_build_system_hack
     from . import repls
-    from .repllibs import PyDbLite
+    from .repls import ioloop
+    from .repllibs import PyDbLite, procstat
+    from .repllibs.fuzzy import FuzzySearch
+    from .repllibs.historylog import HistoryLog, bounded
+    from .repllibs.terminal import AnsiParser, CarriageReturnFilter
     unicode_type = str
+    unichr = chr
     PY2 = False
-except ImportError:
+except (ImportError, ValueError):
     import sublimerepl_build_system_hack
     import repls
-    from repllibs import PyDbLite
-    import Queue as queue
+    from repls import ioloop
+    from repllibs import PyDbLite, procstat
+    from repllibs.fuzzy import FuzzySearch
+    from repllibs.historylog import HistoryLog, bounded
+    from repllibs.terminal import AnsiParser, CarriageReturnFilter
     unicode_type = unicode
     PY2 = True
 
@@ -34,6 +46,59 @@ PLATFORM = sublime.platform().lower()
 SETTINGS_FILE = 'SublimeREPL.sublime-settings'
 SUBLIME2 = sublime.version() < '3000'
 
+if SUBLIME2:
+    ANSI_REGION_FLAGS = sublime.DRAW_OUTLINED
+else:
+    ANSI_REGION_FLAGS = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE | sublime.DRAW_SOLID_UNDERLINE
+
+# Output from the REPL is drained right away when it arrives after a quiet
+# period. While it keeps streaming, drains are spaced out exponentially up to
+# UPDATE_DELAY_MAX milliseconds so the UI thread isn't woken for every chunk.
+UPDATE_DELAY_MAX = 50
+UPDATE_STREAMING_WINDOW = 0.05
+
+# Output flood protection. In "block" mode ReplReader stops reading (so the
+# REPL process blocks on write) when output comes faster than the view takes
+# it. In "elide" mode the excess is dropped and replaced by a marker and the
+# last ELIDE_TAIL chars once output fits the limits again (or stops for
+# ELIDE_QUIET seconds).
+FLOOD_BLOCK = "block"
+FLOOD_ELIDE = "elide"
+ELIDE_QUIET = 0.25
+ELIDE_TAIL = 2048
+ELIDE_MARKER = "\n[... {0} characters elided ...]\n"
+
+# When the view outgrows its scrollback limits, oldest output is erased down
+# to this fraction of the limit, so trimming happens in bulk and not on
+# every write.
+SCROLLBACK_TRIM_RATIO = 0.9
+
+# Output of a single evaluation beyond spill_output_threshold characters is
+# written to a file. The view keeps what it got before, a marker and the
+# last SPILL_TAIL characters.
+SPILL_TAIL = 4096
+SPILL_MARKER = ("\n[... {0} characters of output saved to {1}, "
+                "use 'SublimeREPL: Open Full Output' to see them ...]\n")
+
+# ReplStats status bar segment is refreshed at most this often (seconds)
+STATS_REFRESH = 1.0
+
+# milliseconds between updates of "REPL input" status while input is being sent
+INPUT_STATUS_REFRESH = 250
+
+# once output of a REPL ends, its process is checked for an exit status up to
+# EXIT_STATUS_ATTEMPTS times, EXIT_STATUS_DELAY ms apart
+EXIT_STATUS_ATTEMPTS = 20
+EXIT_STATUS_DELAY = 10
+
+# replay sends the next command once output of the previous one is quiet
+# for REPLAY_QUIET ms, or when there was none at all for REPLAY_SILENCE ms
+REPLAY_QUIET = 100
+REPLAY_SILENCE = 2000
+
+# ranked matches of history search one can cycle through
+HISTORY_SEARCH_RESULTS = 100
+
 RESTART_MSG = """
 #############
 ## RESTART ##
@@ -57,40 +122,384 @@ class ReplPass(sublime_plugin.TextCommand):
         pass
 
 
-class ReplReader(threading.Thread):
-    def __init__(self, repl):
-        super(ReplReader, self).__init__()
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "%.0f %s" % (size, unit) if unit == "B" else "%.1f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f GB" % size
+
+
+class ReplStats(object):
+    """Throughput and latency counters of a single REPL. Updated by
+       ReplReader (from reader thread) and ReplView"""
+
+    def __init__(self, repl, reader):
         self.repl = repl
-        self.daemon = True
-        self.queue = queue.Queue()
+        self.reader = reader
+        self.started = time.time()
+        self.packets = 0
+        self.chars = 0
+        self.drains = 0
+        self.drain_total = 0.0
+        self.drain_max = 0.0
+        self.drain_last = 0.0
+        self.input_time = None
+        self.first_output_latency = None
+        # snapshot for per second rates: (time, bytes_read, bytes_written, packets)
+        self._snapshot = (self.started, 0, 0, 0)
+        self._rates = (0.0, 0.0, 0.0)
+
+    def on_input(self):
+        self.input_time = time.time()
+
+    def on_packet(self, size):
+        self.packets += 1
+        self.chars += size
+        if self.input_time is not None:
+            self.first_output_latency = time.time() - self.input_time
+            self.input_time = None
+
+    def on_drain(self, duration):
+        self.drains += 1
+        self.drain_total += duration
+        self.drain_last = duration
+        self.drain_max = max(self.drain_max, duration)
+
+    def rates(self):
+        """Returns (bytes in/s, bytes out/s, packets/s) since the last call
+           that was at least STATS_REFRESH ago"""
+        now = time.time()
+        then, bytes_read, bytes_written, packets = self._snapshot
+        elapsed = now - then
+        if elapsed >= STATS_REFRESH:
+            self._rates = ((self.repl.bytes_read - bytes_read) / elapsed,
+                           (self.repl.bytes_written - bytes_written) / elapsed,
+                           (self.packets - packets) / elapsed)
+            self._snapshot = (now, self.repl.bytes_read, self.repl.bytes_written, self.packets)
+        return self._rates
+
+    def status(self):
+        rate_in, rate_out, packet_rate = self.rates()
+        latency = self.first_output_latency
+        return "REPL in %s/s (%.0f pkt/s) out %s/s | queue %s | drain %.1f ms | latency %s" % (
+            format_size(rate_in), packet_rate, format_size(rate_out),
+            format_size(self.reader.backlog()), self.drain_last * 1000,
+            "-" if latency is None else "%.1f ms" % (latency * 1000))
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        latency = self.first_output_latency
+        lines = [
+            ("repl", self.repl.name()),
+            ("uptime", "%.0f s" % elapsed),
+            ("bytes in", "%d (%s/s avg)" % (self.repl.bytes_read, format_size(self.repl.bytes_read / elapsed))),
+            ("bytes out", "%d (%s/s avg)" % (self.repl.bytes_written, format_size(self.repl.bytes_written / elapsed))),
+            ("packets", "%d (%.1f/s avg)" % (self.packets, self.packets / elapsed)),
+            ("characters queued", "%d" % self.chars),
+            ("queue depth", "%d packets, %d characters" % (len(self.reader.queue), self.reader.backlog())),
+            ("drains", "%d" % self.drains),
+            ("drain time", "last %.2f ms, avg %.2f ms, max %.2f ms" % (
+                self.drain_last * 1000, self.drain_total * 1000 / max(self.drains, 1), self.drain_max * 1000)),
+            ("input to first output", "-" if latency is None else "%.1f ms" % (latency * 1000)),
+        ]
+        return "\n".join("%-22s %s" % line for line in lines) + "\n"
+
+
+def packet_size(packet):
+    """Number of characters carried by a (plain or apiv2) packet"""
+    if isinstance(packet, unicode_type):
+        return len(packet)
+    if not packet:
+        return 0
+    return sum(len(data) for (opcode, data) in packet if isinstance(data, unicode_type))
+
+
+class ReplReader(object):
+    """Reads output of a Repl into a queue for ReplView. Repls with a file
+       descriptor are served by the shared ioloop thread, others get
+       a thread of their own"""
+
+    def __init__(self, repl, on_output=None, rate_limit=0, drain_limit=0, flood_mode=FLOOD_BLOCK):
+        self.repl = repl
+        self.queue = deque()
+        # called (from reader thread) when queue goes from empty to non-empty
+        self.on_output = on_output
+        self.rate_limit = rate_limit
+        self.drain_limit = drain_limit
+        self.flood_mode = flood_mode
+        self.stats = ReplStats(repl, self)
+        self._fd = None  # set when served by ioloop
+        self._err_fd = None
+        self._paused = False
+        self._notified = False
+        self._stopped = False
+        self._backlog = 0  # characters in queue
+        self._tokens = rate_limit
+        self._tokens_time = time.time()
+        self._elided = 0
+        self._elided_tail = ""
+        self._elided_time = 0
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+
+    def start(self):
+        fd = self.repl.fileno()
+        err_fd = self.repl.stderr_fileno()
+        if fd is not None and ioloop.available():
+            self._fd = fd
+            ioloop.instance().register(fd, self.on_readable)
+            if err_fd is not None:
+                self._err_fd = err_fd
+                ioloop.instance().register(err_fd, self.on_stderr_readable)
+            return
+        targets = [self.run]
+        if err_fd is not None:
+            targets.append(self.run_stderr)
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
 
     def run(self):
         r = self.repl
-        q = self.queue
         while True:
             result = r.read()
-            q.put(result)
+            self.put(result)
             if result is None:
                 break
 
+    def on_readable(self):
+        """Called from ioloop thread, returns False once output died"""
+        result = self.repl.read_available()
+        if result == "":
+            return True
+        self.put(result)
+        return result is not None
+
+    def run_stderr(self):
+        fd = self.repl.stderr_fileno()
+        while True:
+            select.select([fd], [], [])
+            if not self.on_stderr_readable():
+                break
+
+    def on_stderr_readable(self):
+        """Separate error output goes to the queue as 'stderr' packets, in
+           the order it's read relative to the rest"""
+        result = self.repl.read_stderr_available()
+        if result == "":
+            return True
+        if result is None:
+            return False  # end of output is reported by stdout
+        self.put([('stderr', result)])
+        return True
+
+    def stop(self):
+        """Called when nobody is going to drain this reader anymore"""
+        with self._lock:
+            self._stopped = True
+            self._drained.notify_all()
+            if self._paused:
+                self._paused = False
+                self._resume()
+
+    def backlog(self):
+        return self._backlog
+
+    def put(self, packet):
+        size = packet_size(packet)
+        self.stats.on_packet(size)
+        with self._lock:
+            if packet is not None and self._should_elide(packet, size):
+                self._elided += size
+                self._elided_tail = (self._elided_tail + packet)[-ELIDE_TAIL:]
+                self._elided_time = time.time()
+            else:
+                if self._elided and isinstance(packet, unicode_type):
+                    # flood is over, what was dropped goes before the new output
+                    for text in self._end_elision():
+                        self.queue.append(text)
+                        self._backlog += len(text)
+                if self._fd is not None:
+                    self.queue.append(packet)
+                    self._backlog += size
+                    self._pause(size)
+                else:
+                    self._throttle(size)
+                    self.queue.append(packet)
+                    self._backlog += size
+            notify = not self._notified
+            self._notified = True
+        if notify and self.on_output:
+            self.on_output()
+
+    def _take_tokens(self, size):
+        """Token bucket for rate_limit, returns seconds until size is paid off"""
+        now = time.time()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._tokens_time) * self.rate_limit)
+        self._tokens_time = now
+        self._tokens -= size
+        return -self._tokens / self.rate_limit if self._tokens < 0 else 0
+
+    def _should_elide(self, packet, size):
+        if self.flood_mode != FLOOD_ELIDE or not isinstance(packet, unicode_type):
+            return False
+        over_rate = False
+        if self.rate_limit:
+            over_rate = self._take_tokens(size) > 0
+            # dropped output is never shown, owing more than a second's
+            # worth for it would keep eliding long after the flood
+            self._tokens = max(self._tokens, -self.rate_limit)
+        if self._elided:
+            # flood is not over until output fits the limits again
+            return over_rate or bool(self.drain_limit and self._backlog + size > self.drain_limit)
+        if self.drain_limit and self._backlog + size > 2 * self.drain_limit:
+            return True
+        return over_rate
+
+    def _end_elision(self):
+        """Returns marker and tail of elided output to show in its place"""
+        texts = [ELIDE_MARKER.format(self._elided - len(self._elided_tail)), self._elided_tail]
+        self._elided = 0
+        self._elided_tail = ""
+        return texts
+
+    def _throttle(self, size):
+        """Blocks (with lock held by the caller) until the view catches up"""
+        if self.flood_mode != FLOOD_BLOCK:
+            return
+        if self.rate_limit and size:
+            delay = self._take_tokens(size)
+            if delay > 0:
+                self._lock.release()
+                try:
+                    time.sleep(delay)
+                finally:
+                    self._lock.acquire()
+        while self.drain_limit and self._backlog >= 2 * self.drain_limit and not self._stopped:
+            self._drained.wait(1.0)
+
+    def _pause(self, size):
+        """ioloop can't block like _throttle, it stops watching our fd instead"""
+        if self.flood_mode != FLOOD_BLOCK or self._stopped:
+            return
+        if self.rate_limit and size:
+            delay = self._take_tokens(size)
+            if delay > 0:
+                for fd in self._fds():
+                    ioloop.instance().pause(fd, delay)
+        if self.drain_limit and self._backlog >= 2 * self.drain_limit:
+            self._paused = True
+            for fd in self._fds():
+                ioloop.instance().pause(fd)
+
+    def _fds(self):
+        return [fd for fd in (self._fd, self._err_fd) if fd is not None]
+
+    def _resume(self):
+        for fd in self._fds():
+            ioloop.instance().resume(fd)
+
+    def acknowledge(self):
+        """Must be called by the consumer before draining the queue, so
+           that output arriving during the drain schedules another one"""
+        with self._lock:
+            self._notified = False
+
+    def drain(self):
+        """Returns (packets, is_still_working, pending). Takes about
+           drain_limit characters of output; pending is true when there is
+           more to take later"""
+        packets = []
+        is_still_working = True
+        taken = 0
+        with self._lock:
+            while self.queue:
+                if self.drain_limit and taken >= self.drain_limit:
+                    break
+                packet = self.queue.popleft()
+                if packet is None:
+                    is_still_working = False
+                    break
+                size = packet_size(packet)
+                if self.drain_limit and taken + size > self.drain_limit and isinstance(packet, unicode_type):
+                    # split large packet, rest goes back to the front of the queue
+                    rest = packet[self.drain_limit - taken:]
+                    packet = packet[:self.drain_limit - taken]
+                    self.queue.appendleft(rest)
+                    size = len(packet)
+                packets.append(packet)
+                taken += size
+                self._backlog -= size
+
+            if self.queue or (is_still_working and self._elided):
+                pending = True
+            else:
+                pending = False
+            if self._elided and not self.queue and (not is_still_working or
+                                                   time.time() - self._elided_time > ELIDE_QUIET):
+                packets.extend(self._end_elision())
+                pending = False
+            self._drained.notify_all()
+            if self._paused and self._backlog < 2 * self.drain_limit:
+                self._paused = False
+                self._resume()
+        return packets, is_still_working, pending
+
+
+# History.match() collects positions of up to this many matches up front,
+# more common prefixes are found by scanning history from the cursor
+MATERIALIZE_MAX = 65536
+
+# sorts after any string starting with a given prefix
+PREFIX_END = unichr(sys.maxunicode)
+
 
 class HistoryMatchList(object):
-    def __init__(self, command_prefix, commands):
+    """Cursor over commands starting with command_prefix, oldest first.
+       positions are indices of the matching commands, when None the
+       matches are looked for only as the cursor moves"""
+
+    def __init__(self, command_prefix, commands, positions=None):
         self._command_prefix = command_prefix
         self._commands = commands
-        self._cur = len(commands)  # no '-1' on purpose
+        self._end = len(commands)  # later commands are not part of this match
+        self._positions = positions
+        self._cur = None  # index into commands, None before the first move
+        self._cur_match = len(positions) if positions is not None else None
 
     def current_command(self):
-        if not self._commands:
+        if self._cur is None:
             return ""
         return self._commands[self._cur]
 
     def prev_command(self):
-        self._cur = max(0, self._cur - 1)
+        if self._positions is not None:
+            if self._positions:
+                self._cur_match = max(0, self._cur_match - 1)
+                self._cur = self._positions[self._cur_match]
+            return self.current_command()
+        start = self._end if self._cur is None else self._cur
+        for i in range(start - 1, -1, -1):
+            if self._commands[i].startswith(self._command_prefix):
+                self._cur = i
+                break
         return self.current_command()
 
     def next_command(self):
-        self._cur = min(len(self._commands) - 1, self._cur + 1)
+        if self._positions is not None:
+            if self._positions:
+                self._cur_match = min(len(self._positions) - 1, self._cur_match + 1)
+                self._cur = self._positions[self._cur_match]
+            return self.current_command()
+        if self._cur is None:
+            # starting past the end, so the newest match is the next one
+            return self.prev_command()
+        for i in range(self._cur + 1, self._end):
+            if self._commands[i].startswith(self._command_prefix):
+                self._cur = i
+                break
         return self.current_command()
 
 
@@ -111,45 +520,166 @@ class History(object):
     def match(self, command_prefix):
         raise NotImplementedError()
 
+    def unique_commands(self):
+        """Returns every command once, newest first"""
+        raise NotImplementedError()
+
 
 class MemHistory(History):
     def __init__(self):
         super(MemHistory, self).__init__()
         self._stack = []
+        self._index = []  # (command, position in _stack), sorted
+
+    def set_commands(self, commands):
+        self._stack = commands
+        self._index = sorted((cmd, i) for i, cmd in enumerate(commands))
 
     def append(self, cmd):
+        insort(self._index, (cmd, len(self._stack)))
         self._stack.append(cmd)
 
     def match(self, command_prefix):
-        matching_commands = []
-        for cmd in self._stack:
-            if cmd.startswith(command_prefix):
-                matching_commands.append(cmd)
-        return HistoryMatchList(command_prefix, matching_commands)
+        if not command_prefix:
+            return HistoryMatchList(command_prefix, self._stack)
+        lo = bisect_left(self._index, (command_prefix,))
+        hi = bisect_left(self._index, (command_prefix + PREFIX_END,), lo)
+        if hi - lo > MATERIALIZE_MAX:
+            return HistoryMatchList(command_prefix, self._stack)
+        positions = sorted(i for (cmd, i) in self._index[lo:hi])
+        return HistoryMatchList(command_prefix, self._stack, positions)
+
+    def unique_commands(self):
+        seen = set()
+        commands = []
+        for cmd in reversed(self._stack):
+            if cmd not in seen:
+                seen.add(cmd)
+                commands.append(cmd)
+        return commands
 
 
 class PersistentHistory(MemHistory):
-    def __init__(self, external_id):
+    """History shared by every REPL with the same external_id, kept in an
+       append-only log (see repllibs.historylog). Entries past the limits
+       are dropped when the log is compacted.
+
+       The log is read in a background thread, so opening a REPL doesn't
+       wait for it. Commands pushed meanwhile are held back until it's
+       done, navigating history waits for it"""
+
+    # log is compacted in the background after this many appends
+    COMPACT_EVERY = 1000
+
+    def __init__(self, external_id, max_entries=None, max_age=None, unique=False):
         super(PersistentHistory, self).__init__()
         path = os.path.join(sublime.packages_path(), "User", ".SublimeREPLHistory")
         if not os.path.isdir(path):
             os.makedirs(path)
-        filepath = os.path.join(path, external_id + ".db")
-        self._db = PyDbLite.Base(filepath)
         self._external_id = external_id
-        self._db.create("external_id", "command", "ts", mode="open")
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._unique = unique
+        self._log = HistoryLog.get(os.path.join(path, external_id + ".log"))
+        self._appended = 0
+        self._lock = threading.Lock()
+        self._pending = []  # (ts, command) pushed before the load finished
+        self._loaded = threading.Event()
+        loader = threading.Thread(target=self.load, args=(os.path.join(path, external_id + ".db"),))
+        loader.daemon = True
+        loader.start()
+
+    def load(self, db_path):
+        try:
+            self.migrate(db_path)
+            entries = self._log.load()
+            kept = self.bounded(entries)
+            self.set_commands([command for (ts, command) in kept])
+            if len(kept) < len(entries):
+                self._log.compact(self.bounded)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                for ts, cmd in self._pending:
+                    self._append(ts, cmd)
+                self._pending = None
+            self._loaded.set()
+
+    def bounded(self, entries):
+        return bounded(entries, self._max_entries, self._max_age, self._unique)
+
+    def migrate(self, db_path):
+        """Moves history stored by older versions with PyDbLite to the log"""
+        if os.path.exists(self._log.path) or not os.path.exists(db_path):
+            return
+        try:
+            db = PyDbLite.Base(db_path)
+            db.create("external_id", "command", "ts", mode="open")
+            entries = []
+            for record in sorted(db, key=lambda record: record["__id__"]):
+                ts = record["ts"]
+                ts = time.mktime(ts.timetuple()) + ts.microsecond / 1e6 if ts else 0
+                entries.append((ts, record["command"]))
+            self._log.write(entries)
+            os.rename(db_path, db_path + ".migrated")
+        except Exception:
+            traceback.print_exc()
 
     def append(self, cmd):
-        self._db.insert(external_id=self._external_id, command=cmd, ts=datetime.now())
-        self._db.commit()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((time.time(), cmd))
+            else:
+                self._append(time.time(), cmd)
+
+    def _append(self, ts, cmd):
+        super(PersistentHistory, self).append(cmd)
+        self._log.append(ts, cmd)
+        self._appended += 1
+        if self._appended % self.COMPACT_EVERY == 0:
+            self._log.compact(self.bounded)
+            # commands in memory have no timestamps, those get too old only
+            # by the next load
+            commands = bounded([(None, command) for command in self._stack],
+                               self._max_entries, None, self._unique)
+            self.set_commands([command for (ts, command) in commands])
 
     def match(self, command_prefix):
-        retults = [cmd for cmd in self._db if cmd["command"].startswith(command_prefix)]
-        return HistoryMatchList(command_prefix, [x["command"] for x in retults])
+        self._loaded.wait()
+        return super(PersistentHistory, self).match(command_prefix)
+
+    def unique_commands(self):
+        self._loaded.wait()
+        return super(PersistentHistory, self).unique_commands()
+
+
+class OutputSpill(object):
+    """Output of a single evaluation that was too big for the view"""
+
+    def __init__(self, path, region_key, head):
+        self.path = path
+        self.region_key = region_key
+        self.size = 0
+        self.tail = ""
+        self._file = io.open(path, "w", encoding="utf-8", errors="replace")
+        self.write(head)
+
+    def write(self, text):
+        self._file.write(text)
+        self.size += len(text)
+        self.tail = (self.tail + text)[-SPILL_TAIL:]
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
 
 
 class ReplView(object):
-    def __init__(self, view, repl, syntax, repl_restart_args):
+    def __init__(self, view, repl, syntax, repl_restart_args, reader=None):
         self.repl = repl
         self._view = view
         self._window = view.window()
@@ -162,11 +692,31 @@ class ReplView(object):
         self._output_end = view.size()
         self._prompt_size = 0
 
-        self._repl_reader = ReplReader(repl)
-        self._repl_reader.start()
-
+        self._update_delay = 0
+        self._last_update = 0
+        self._stats_time = 0
+        self._stats_pending = False
+        self._closed = False
+        self._input_watched = False
+        self._input_peak = 0
         settings = sublime.load_settings(SETTINGS_FILE)
 
+        if reader is None:
+            self._repl_reader = ReplView.create_reader(repl, self.schedule_update)
+            self._repl_reader.start()
+        else:
+            # adopted from ReplPool, output so far waits in its queue
+            self._repl_reader = reader
+            reader.on_output = self.schedule_update
+        self.stats = self._repl_reader.stats
+        self._show_stats = settings.get("repl_stats_in_status_bar")
+        # latest procstat.Usage, sampled by ResourceMonitor
+        self.resources = None
+        self._show_resources = settings.get("monitor_in_status_bar")
+        self._monitor_limits = repl_restart_args.get("monitor") or {}
+        self._limit_exceeded = None
+        self._kill_reason = None
+
         view.settings().set("repl_external_id", repl.external_id)
         view.settings().set("repl_id", repl.id)
         view.settings().set("repl", True)
@@ -183,12 +733,45 @@ class ReplView(object):
         # for hysterical rasins ;)
         persistent_history_enabled = settings.get("persistent_history_enabled") or settings.get("presistent_history_enabled")
         if self.external_id and persistent_history_enabled:
-            self._history = PersistentHistory(self.external_id)
+            max_age_days = settings.get("history_max_age_days")
+            self._history = PersistentHistory(
+                self.external_id,
+                max_entries=settings.get("history_max_entries"),
+                max_age=max_age_days * 24 * 3600 if max_age_days else None,
+                unique=settings.get("history_deduplicate", False))
         else:
             self._history = MemHistory()
         self._history_match = None
+        # commands entered since the REPL started, for repl_restart_replay
+        self._session_commands = []
+        self._replay_error_re = None
+        self._replay_queue = deque()  # commands still to replay
+        self._replay_seq = 0  # bumped to cancel a scheduled send_replay
 
         self._filter_color_codes = settings.get("filter_ascii_color_codes")
+        self._ansi_parser = AnsiParser()
+        self._ansi_color_scopes = settings.get("ansi_color_scopes") or {}
+        self._cr_filter = None
+        self._stderr_filters = (AnsiParser(), None)
+        if settings.get("collapse_carriage_returns"):
+            self._cr_filter = CarriageReturnFilter()
+            self._stderr_filters = (AnsiParser(), CarriageReturnFilter())
+        self._scrollback_lines = settings.get("scrollback_lines") or 0
+        self._scrollback_bytes = settings.get("scrollback_bytes") or 0
+
+        self._spill_threshold = settings.get("spill_output_threshold") or 0
+        self._spill = None
+        self._spills = []  # every OutputSpill of this view, oldest first
+        self._evaluation_start = self._output_end
+        self._evaluation_size = 0
+
+        # region key -> (scope, flags) of every region this view maintains
+        self._region_styles = {
+            'sublimerepl': ('invalid', sublime.DRAW_EMPTY | sublime.DRAW_OUTLINED),
+        }
+        for color, scope in self._ansi_color_scopes.items():
+            self._region_styles['sublimerepl_ansi_' + color] = (scope, ANSI_REGION_FLAGS)
+        self._region_styles['sublimerepl_stderr'] = (settings.get("stderr_scope") or "region.redish", ANSI_REGION_FLAGS)
 
         # optionally move view to a different group
         # find current position of this replview
@@ -258,8 +841,24 @@ class ReplView(object):
     def on_selection_modified(self):
         self._view.set_read_only(self.delta > 0)
 
+    @staticmethod
+    def create_reader(repl, on_output=None):
+        settings = sublime.load_settings(SETTINGS_FILE)
+        return ReplReader(repl, on_output,
+                          rate_limit=settings.get("output_rate_limit") or 0,
+                          drain_limit=settings.get("output_drain_limit") or 0,
+                          flood_mode=settings.get("output_flood_mode") or FLOOD_BLOCK)
+
     def on_close(self):
+        self._closed = True
+        self._repl_reader.stop()
         self.repl.close()
+        self.end_evaluation()
+        for spill in self._spills:
+            try:
+                os.remove(spill.path)
+            except OSError:
+                pass
         for fun in self.call_on_close:
             fun(self)
 
@@ -285,7 +884,9 @@ class ReplView(object):
         v.run_command("insert", {"characters": self.repl.cmd_postfix})
         command = self.user_input
         self.adjust_end()
+        self.begin_evaluation()
 
+        self.stats.on_input()
         if self.repl.apiv2:
             self.repl.write(command, location=l)
         else:
@@ -319,21 +920,147 @@ class ReplView(object):
 
     def write(self, unistr):
         """Writes output from Repl into this view."""
-        # remove color codes
+        self.insert_output(unistr)
+        self._view.show(self.input_region)
+
+    def insert_output(self, unistr, stderr=False):
+        """Inserts output before the prompt without scrolling the view"""
+        # separate error output has escape sequences etc. of its own
+        ansi_parser, cr_filter = self._stderr_filters if stderr else (self._ansi_parser, self._cr_filter)
+        spans = []
         if self._filter_color_codes:
-            unistr = re.sub(r'\033\[\d*(;\d*)?\w', '', unistr)
-            unistr = re.sub(r'.\x08', '', unistr)
+            unistr, spans = ansi_parser.feed(unistr)
+        overwrite = False
+        if cr_filter:
+            unistr, spans, overwrite = cr_filter.feed(unistr, spans)
+
+        if self._spill_threshold and (self._spill or self._evaluation_size + len(unistr) > self._spill_threshold):
+            self.spill_output(unistr, spans, overwrite)
+        else:
+            self._evaluation_size += len(unistr)
+            self.insert_text(unistr, spans, overwrite, 'sublimerepl_stderr' if stderr else None)
+        if self._replay_queue:
+            self.check_replay(unistr)
+
+    def insert_text(self, unistr, spans, overwrite=False, region_key=None):
+        """Inserts already filtered output, overwrite replaces the unfinished
+           last line of output. Inserted text is added to region_key"""
+        pos = self._output_end - self._prompt_size
+        if overwrite:
+            line_begin = self._view.line(pos).begin()
+            if line_begin < pos:
+                self._view.run_command("repl_erase_text", {"start": line_begin, "end": pos})
+                self._output_end -= pos - line_begin
+                pos = line_begin
+        if not unistr:
+            return
 
         # string is assumed to be already correctly encoded
-        self._view.run_command("repl_insert_text", {"pos": self._output_end - self._prompt_size, "text": unistr})
+        self._view.run_command("repl_insert_text", {"pos": pos, "text": unistr})
         self._output_end += len(unistr)
-        self._view.show(self.input_region)
+        self.add_color_regions(pos, spans)
+        if region_key:
+            self.add_output_regions(region_key, [sublime.Region(pos, pos + len(unistr))])
+
+    def begin_evaluation(self):
+        """Called when new input is sent to the REPL"""
+        self.end_evaluation()
+        self._evaluation_start = self._output_end
+        self._evaluation_size = 0
+        if not self._input_watched:
+            self._input_watched = True
+            sublime.set_timeout(self.update_input_status, INPUT_STATUS_REFRESH)
+
+    def update_input_status(self):
+        """Shows how much of the input is still waiting to be delivered to
+           the repl, for as long as there is any"""
+        pending = self.repl.pending_input()
+        if not pending:
+            self._input_watched = False
+            self._input_peak = 0
+            self._view.erase_status("repl_input")
+            return
+        self._input_peak = max(self._input_peak, pending)
+        self._view.set_status("repl_input", "REPL input: %d%% sent, %s left" % (
+            100 * (self._input_peak - pending) // self._input_peak, format_size(pending)))
+        sublime.set_timeout(self.update_input_status, INPUT_STATUS_REFRESH)
+
+    def cancel_input(self):
+        discarded = self.repl.cancel_input()
+        if discarded:
+            sublime.status_message("SublimeREPL: discarded %s of unsent input" % format_size(discarded))
+
+    def end_evaluation(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def spill_output(self, unistr, spans, overwrite):
+        """Writes output of current evaluation to a file, once it crosses
+           spill_output_threshold. The view shows only its tail"""
+        if not self._spill:
+            room = max(0, self._spill_threshold - self._evaluation_size)
+            head_spans = [(b, min(e, room), c) for (b, e, c) in spans if b < room]
+            self.insert_text(unistr[:room], head_spans, overwrite)
+            unistr = unistr[room:]
+            pos = self._output_end - self._prompt_size
+            head = self._view.substr(sublime.Region(min(self._evaluation_start, pos), pos))
+            self._spill = OutputSpill(self.spill_path(), "sublimerepl_spill_%d" % len(self._spills), head)
+            self._spills.append(self._spill)
+            self._region_styles[self._spill.region_key] = ('comment', sublime.DRAW_OUTLINED)
+
+        self._spill.write(unistr)
+        self._evaluation_size += len(unistr)
+
+        # replace previous marker and tail with the current ones
+        v = self._view
+        key = self._spill.region_key
+        pos = self._output_end - self._prompt_size
+        regions = v.get_regions(key)
+        start = min(regions[0].begin(), pos) if regions else pos
+        if start < pos:
+            v.run_command("repl_erase_text", {"start": start, "end": pos})
+            self._output_end -= pos - start
+        marker = SPILL_MARKER.format(self._spill.size, self._spill.path)
+        v.run_command("repl_insert_text", {"pos": start, "text": marker + self._spill.tail})
+        self._output_end += len(marker) + len(self._spill.tail)
+        scope, flags = self._region_styles[key]
+        v.add_regions(key, [sublime.Region(start, start + len(marker))], scope, '', flags)
+
+    def spill_path(self):
+        path = os.path.join(sublime.packages_path(), "User", ".SublimeREPLOutput")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return os.path.join(path, "%s-%d.txt" % (self.repl.id, len(self._spills)))
+
+    def open_full_output(self):
+        """Opens spilled output under the cursor, or the latest one"""
+        if not self._spills:
+            return
+        spill = self._spills[-1]
+        caret = self._view.sel()[0].begin()
+        for candidate in self._spills:
+            for region in self._view.get_regions(candidate.region_key):
+                if region.begin() <= caret <= region.end():
+                    spill = candidate
+        spill.flush()
+        self._window.open_file(spill.path)
+
+    def add_color_regions(self, pos, spans):
+        """Renders (begin, end, color) spans of text inserted at pos"""
+        by_color = {}
+        for begin, end, color in spans:
+            if color in self._ansi_color_scopes:
+                by_color.setdefault(color, []).append(sublime.Region(pos + begin, pos + end))
+        for color, regions in by_color.items():
+            self.add_output_regions('sublimerepl_ansi_' + color, regions)
 
     def write_prompt(self, unistr):
         """Writes prompt from REPL into this view. Prompt is treated like
            regular output, except output is inserted before the prompt."""
+        self.end_evaluation()
         self._prompt_size = 0
-        self.write(unistr)
+        self.insert_output(unistr)
         self._prompt_size = len(unistr)
 
     def append_input_text(self, text, edit=None):
@@ -343,53 +1070,232 @@ class ReplView(object):
             self._view.run_command("repl_insert_text", {"pos": self._view.size(), "text": text})
 
     def handle_repl_output(self):
-        """Returns new data from Repl and bool indicating if Repl is still
-           working"""
-        try:
-            while True:
-                packet = self._repl_reader.queue.get_nowait()
-                if packet is None:
-                    return False
-
-                self.handle_repl_packet(packet)
-
-        except queue.Empty:
-            return True
-
-    def handle_repl_packet(self, packet):
-        if self.repl.apiv2:
+        """Writes queued output from Repl into the view and returns bool
+           indicating if Repl is still working"""
+        self._repl_reader.acknowledge()
+        start = time.time()
+        packets, is_still_working, pending = self._repl_reader.drain()
+        if packets:
+            self.handle_repl_packets(packets)
+            self.trim_scrollback()
+            self._view.show(self.input_region)
+            self.stats.on_drain(time.time() - start)
+            self.update_stats_status()
+        if pending and is_still_working:
+            sublime.set_timeout(self.update_view_loop, max(self._update_delay, 1))
+        return is_still_working
+
+    def handle_repl_packets(self, packets):
+        """Applies a batch of packets to the view. Consecutive output is
+           joined so that it's inserted with a single edit"""
+        pending = []
+        for packet in packets:
+            if isinstance(packet, unicode_type):
+                pending.append(packet)
+                continue
             for opcode, data in packet:
                 if opcode == 'output':
-                    self.write(data)
-                elif opcode == 'prompt':
+                    pending.append(data)
+                    continue
+                if pending:
+                    self.insert_output("".join(pending))
+                    pending = []
+                if opcode == 'prompt':
                     self.write_prompt(data)
+                elif opcode == 'stderr':
+                    self.insert_output(data, stderr=True)
                 elif opcode == 'highlight':
                     a, b = data
-                    regions = self._view.get_regions('sublimerepl')
-                    regions.append(sublime.Region(a, b))
-                    self._view.add_regions('sublimerepl', regions, 'invalid',
-                                           '', sublime.DRAW_EMPTY | sublime.DRAW_OUTLINED)
+                    self.add_output_regions('sublimerepl', [sublime.Region(a, b)])
                 else:
                     print('SublimeREPL: unknown REPL opcode: ' + opcode)
-        else:
-            self.write(packet)
+        if pending:
+            self.insert_output("".join(pending))
+
+    def handle_repl_packet(self, packet):
+        self.handle_repl_packets([packet])
+
+    def add_output_regions(self, key, regions):
+        scope, flags = self._region_styles[key]
+        existing = self._view.get_regions(key)
+        if existing and regions and existing[-1].end() == regions[0].begin():
+            # output arriving in chunks shouldn't pile up regions
+            regions[0] = existing.pop().cover(regions[0])
+        regions = existing + regions
+        self._view.add_regions(key, regions, scope, '', flags)
+
+    def trim_scrollback(self):
+        """Erases the oldest output once the view outgrows scrollback_lines
+           or scrollback_bytes"""
+        v = self._view
+        size = v.size()
+        cut = 0
+        if self._scrollback_bytes and size > self._scrollback_bytes:
+            cut = size - int(self._scrollback_bytes * SCROLLBACK_TRIM_RATIO)
+        if self._scrollback_lines:
+            lines = v.rowcol(size)[0] + 1
+            if lines > self._scrollback_lines:
+                keep = int(self._scrollback_lines * SCROLLBACK_TRIM_RATIO)
+                cut = max(cut, v.text_point(lines - keep, 0))
+        if not cut:
+            return
+
+        # never cut into the prompt and don't leave half a line behind
+        cut = min(cut, self._output_end - self._prompt_size)
+        if cut > 0 and v.substr(sublime.Region(cut - 1, cut)) != "\n":
+            cut = min(v.full_line(cut).end(), self._output_end - self._prompt_size)
+        if cut <= 0:
+            return
+
+        v.run_command("repl_erase_text", {"start": 0, "end": cut})
+        self._output_end -= cut
+        self._evaluation_start = max(0, self._evaluation_start - cut)
+
+        # regions that were completely erased collapse to the beginning
+        for key, (scope, flags) in self._region_styles.items():
+            regions = [r for r in v.get_regions(key) if not r.empty()]
+            v.add_regions(key, regions, scope, '', flags)
+
+    def update_stats_status(self):
+        """Refreshes status bar segment, at most once per STATS_REFRESH"""
+        if not self._show_stats:
+            return
+        if time.time() - self._stats_time >= STATS_REFRESH:
+            self.refresh_stats_status()
+        elif not self._stats_pending:
+            # make sure the final state is shown once output stops
+            self._stats_pending = True
+            sublime.set_timeout(self.refresh_stats_status, int(STATS_REFRESH * 1000))
+
+    def refresh_stats_status(self):
+        self._stats_pending = False
+        self._stats_time = time.time()
+        self._view.set_status("repl_stats", self.stats.status())
+
+    def update_resources(self, usage):
+        """Called by ResourceMonitor with a fresh sample"""
+        self.resources = usage
+        if usage is None or not self.repl.is_alive():
+            self._view.erase_status("repl_resources")
+            return
+        if self._show_resources:
+            self._view.set_status("repl_resources", "CPU %.0f%% | RSS %s | %d fds" % (
+                usage.cpu, format_size(usage.rss), usage.fds))
+        exceeded = self.exceeded_limit(usage)
+        if exceeded and exceeded != self._limit_exceeded:
+            if self._monitor_limits.get("action") == "kill":
+                sublime.status_message("SublimeREPL: killing %s, %s" % (self.repl.name(), exceeded))
+                self._kill_reason = exceeded
+                self.repl.kill()
+            else:
+                sublime.status_message("SublimeREPL: %s %s" % (self.repl.name(), exceeded))
+        self._limit_exceeded = exceeded
+
+    def exceeded_limit(self, usage):
+        """Returns description of the first exceeded "monitor" limit or None"""
+        limits = self._monitor_limits
+        if limits.get("rss_limit") and usage.rss > limits["rss_limit"] * 1024 * 1024:
+            return "uses %s of memory" % format_size(usage.rss)
+        if limits.get("cpu_limit") and usage.cpu > limits["cpu_limit"]:
+            return "uses %.0f%% CPU" % usage.cpu
+        if limits.get("fds_limit") and usage.fds > limits["fds_limit"]:
+            return "has %d files open" % usage.fds
+        return None
+
+    def schedule_update(self):
+        """Called from the reader thread when new output is waiting"""
+        sublime.set_timeout(self.update_view_loop, self._update_delay)
 
     def update_view_loop(self):
-        is_still_working = self.handle_repl_output()
-        if is_still_working:
-            sublime.set_timeout(self.update_view_loop, 100)
+        if self._closed:
+            return  # view may be taken over by a restarted REPL already
+        now = time.time()
+        if now - self._last_update < UPDATE_STREAMING_WINDOW:
+            self._update_delay = min(UPDATE_DELAY_MAX, max(1, self._update_delay * 2))
         else:
-            self.write("\n***Repl Killed***\n""" if self.repl._killed else "\n***Repl Closed***\n""")
-            self._view.set_read_only(True)
-            if sublime.load_settings(SETTINGS_FILE).get("view_auto_close"):
-                window = self._view.window()
-                if window is not None:
-                    window.focus_view(self._view)
-                    window.run_command("close")
+            self._update_delay = 0
+        self._last_update = now
+
+        is_still_working = self.handle_repl_output()
+        if not is_still_working:
+            self.report_closed()
+
+    def report_closed(self, attempts=EXIT_STATUS_ATTEMPTS):
+        """Tells why the REPL is gone. Output ends just before the process
+           does, so this waits a bit for its exit status to show up"""
+        if self._closed:
+            return
+        reason = self._kill_reason
+        if not self.repl._killed:
+            if attempts and self.repl.is_alive():
+                sublime.set_timeout(lambda: self.report_closed(attempts - 1), EXIT_STATUS_DELAY)
+                return
+            reason = self.repl.exit_reason()
+        self.write("\n***Repl %s%s***\n" % ("Killed" if self.repl._killed else "Closed",
+                                            ": " + reason if reason else ""))
+        self._view.set_read_only(True)
+        if sublime.load_settings(SETTINGS_FILE).get("view_auto_close"):
+            window = self._view.window()
+            if window is not None:
+                window.focus_view(self._view)
+                window.run_command("close")
 
     def push_history(self, command):
         self._history.push(command)
         self._history_match = None
+        if command.strip():
+            self._session_commands.append(command)
+
+    @property
+    def session_commands(self):
+        return list(self._session_commands)
+
+    def replay(self, commands):
+        """Sends commands of a previous session without showing them, one
+           at a time. Each waits for output of the previous one to settle,
+           the rest are skipped once output matches replay_error_pattern"""
+        if not commands:
+            return
+        self._session_commands = list(commands)
+        self.write("***Replaying %d commands***\n" % len(commands))
+        pattern = sublime.load_settings(SETTINGS_FILE).get("replay_error_pattern")
+        self._replay_error_re = re.compile(pattern, re.MULTILINE) if pattern else None
+        self._replay_queue = deque(commands)
+        self.send_replay()
+
+    def send_replay(self):
+        if self._closed or not self.repl.is_alive():
+            self._replay_queue.clear()
+            return
+        command = self._replay_queue.popleft()
+        self.begin_evaluation()
+        self.stats.on_input()
+        if self.repl.apiv2:
+            self.repl.write(command + self.repl.cmd_postfix, location=self._output_end)
+        else:
+            self.repl.write(command + self.repl.cmd_postfix)
+        if self._replay_queue:
+            self.schedule_replay(REPLAY_SILENCE)
+
+    def schedule_replay(self, delay):
+        """Sends the next command after delay ms, unless rescheduled"""
+        self._replay_seq += 1
+        seq = self._replay_seq
+
+        def send():
+            if seq == self._replay_seq and self._replay_queue:
+                self.send_replay()
+        sublime.set_timeout(send, delay)
+
+    def check_replay(self, unistr):
+        """Called with output while commands wait to be replayed"""
+        if self._replay_error_re is not None and self._replay_error_re.search(unistr):
+            skipped = len(self._replay_queue)
+            self._replay_queue.clear()
+            self._replay_seq += 1
+            self.insert_text("\n***Replay stopped at an error, %d commands skipped***\n" % skipped, [])
+        else:
+            self.schedule_replay(REPLAY_QUIET)
 
     def ensure_history_match(self):
         user_input = self.user_input
@@ -400,6 +1306,10 @@ class ReplView(object):
         if self._history_match is None:
             self._history_match = self._history.match(user_input)
 
+    def search_history(self):
+        """Returns FuzzySearch over history of this REPL"""
+        return FuzzySearch(self._history.unique_commands())
+
     def replace_current_input(self, edit, cmd):
         if cmd:
             self._view.replace(edit, self.input_region, cmd)
@@ -450,10 +1360,203 @@ class ReplView(object):
         return True
 
 
+class ReplPool(object):
+    """Spare REPLs for repl_open argument sets with "pool": N. They are
+       spawned ahead of time so interpreter startup is already over when
+       one gets adopted by a view; a replacement is spawned right away"""
+
+    def __init__(self):
+        self._spares = {}  # key -> [(repl, reader), ...]
+        self._spawning = {}  # key -> number of spares being spawned
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(type, encoding, kwds):
+        """kwds must be already translated, $file_path etc. are part of the key"""
+        return json.dumps([type, encoding, kwds], sort_keys=True)
+
+    def take(self, size, type, encoding, kwds):
+        """Returns (repl, reader) of a live spare or None, refills the pool"""
+        key = ReplPool.key(type, encoding, kwds)
+        spare = None
+        with self._lock:
+            spares = self._spares.get(key, [])
+            while spares and spare is None:
+                repl, reader = spares.pop(0)
+                if repl.is_alive():
+                    spare = (repl, reader)
+                else:
+                    reader.stop()
+        self.fill(size, type, encoding, kwds)
+        return spare
+
+    def fill(self, size, type, encoding, kwds):
+        """Spawns spares in the background until there are size of them"""
+        key = ReplPool.key(type, encoding, kwds)
+        with self._lock:
+            missing = size - len(self._spares.get(key, [])) - self._spawning.get(key, 0)
+            if missing <= 0:
+                return
+            self._spawning[key] = self._spawning.get(key, 0) + missing
+
+        def spawn():
+            for _ in range(missing):
+                try:
+                    repl = repls.Repl.subclass(type)(encoding, **kwds)
+                    reader = ReplView.create_reader(repl)
+                    reader.start()
+                    with self._lock:
+                        self._spares.setdefault(key, []).append((repl, reader))
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    with self._lock:
+                        self._spawning[key] -= 1
+
+        thread = threading.Thread(target=spawn)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        with self._lock:
+            spares = [spare for spares in self._spares.values() for spare in spares]
+            self._spares = {}
+        for repl, reader in spares:
+            reader.stop()
+            repl.close()
+
+
+class ResourceMonitor(object):
+    """Samples resource usage of every REPL process tree in a background
+       thread and hands the results to ReplViews on the main thread. The
+       thread stops once no REPL has a process, start() is called again
+       when a REPL opens"""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+        self._monitors = {}  # repl id -> procstat.TreeMonitor
+
+    def start(self):
+        if not procstat.available():
+            return
+        if not sublime.load_settings(SETTINGS_FILE).get("monitor_interval"):
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    @staticmethod
+    def processes():
+        """Returns ReplViews whose REPL has a process"""
+        return [rv for rv in list(manager.repl_views.values()) if rv.repl.pid() is not None]
+
+    def run(self):
+        while True:
+            interval = sublime.load_settings(SETTINGS_FILE).get("monitor_interval")
+            if interval:
+                time.sleep(interval)
+            with self._lock:
+                repl_views = self.processes()
+                if not interval or not any(rv.repl.is_alive() for rv in repl_views):
+                    self._thread = None
+                    self._monitors = {}
+                    # dead REPLs drop their numbers from the status bar
+                    gone = [(rv, None) for rv in repl_views]
+                    sublime.set_timeout(lambda: self.apply(gone), 0)
+                    return
+            try:
+                samples = self.sample(repl_views)
+            except Exception:
+                traceback.print_exc()
+                continue
+            sublime.set_timeout(lambda samples=samples: self.apply(samples), 0)
+
+    def sample(self, repl_views):
+        """Returns [(ReplView, procstat.Usage or None), ...]"""
+        samples = []
+        if not any(rv.repl.pid() is not None for rv in repl_views):
+            return samples  # not worth reading all of /proc
+        children = procstat.children_map()
+        monitors = {}
+        for rv in repl_views:
+            pid = rv.repl.pid()
+            if pid is None:
+                continue
+            monitor = self._monitors.get(rv.repl.id)
+            if monitor is None or monitor.pid != pid:
+                monitor = procstat.TreeMonitor(pid)
+            monitors[rv.repl.id] = monitor
+            samples.append((rv, monitor.sample(children)))
+        self._monitors = monitors
+        return samples
+
+    @staticmethod
+    def apply(samples):
+        for rv, usage in samples:
+            if rv.repl.id in manager.repl_views:
+                rv.update_resources(usage)
+
+
+class HistorySearch(object):
+    """Reverse search through history of a REPL view. The best match of the
+       query is shown in REPL input as it's typed, running repl_history_search
+       again moves on to the next one. Cancelling brings back the input
+       from before the search"""
+
+    active = None
+
+    def __init__(self, rv):
+        self.rv = rv
+        self.original = rv.user_input
+        self.search = rv.search_history()
+        self.matches = []
+        self.current = 0
+
+    def start(self, window):
+        HistorySearch.active = self
+        panel = window.show_input_panel("History search:", "", self.on_done, self.on_change, self.on_cancel)
+        panel.settings().set("repl_history_search", True)
+
+    def on_change(self, query):
+        self.matches = self.search.search(query, HISTORY_SEARCH_RESULTS) if query else []
+        self.current = 0
+        self.show()
+
+    def next_match(self):
+        if self.matches:
+            self.current = (self.current + 1) % len(self.matches)
+            self.show()
+
+    def show(self):
+        if self.matches:
+            self.set_input(self.matches[self.current])
+            sublime.status_message("History search: match %d of %d" % (self.current + 1, len(self.matches)))
+        else:
+            self.set_input(self.original)
+
+    def set_input(self, text):
+        self.rv.view.run_command("repl_replace_input", {"text": text})
+
+    def on_done(self, query):
+        HistorySearch.active = None
+        if self.matches:
+            self.set_input(self.matches[self.current])
+        self.rv.view.window().focus_view(self.rv.view)
+
+    def on_cancel(self):
+        HistorySearch.active = None
+        self.set_input(self.original)
+
+
 class ReplManager(object):
 
     def __init__(self):
         self.repl_views = {}
+        self.pool = ReplPool()
 
     def repl_view(self, view):
         repl_id = view.settings().get("repl_id")
@@ -484,7 +1587,15 @@ class ReplManager(object):
         try:
             kwds = ReplManager.translate(window, kwds)
             encoding = ReplManager.translate(window, encoding)
-            r = repls.Repl.subclass(type)(encoding, **kwds)
+            kwds.pop("monitor", None)  # ReplView takes it from repl_restart_args
+            pool_size = kwds.pop("pool", 0)
+            spare = None
+            if pool_size:
+                spare = self.pool.take(pool_size, type, encoding, kwds)
+            if spare:
+                r, reader = spare
+            else:
+                r, reader = repls.Repl.subclass(type)(encoding, **kwds), None
             found = None
             for view in window.views():
                 if view.id() == view_id:
@@ -492,9 +1603,10 @@ class ReplManager(object):
                     break
             view = found or window.new_file()
 
-            rv = ReplView(view, r, syntax, repl_restart_args)
+            rv = ReplView(view, r, syntax, repl_restart_args, reader)
             rv.call_on_close.append(self._delete_repl)
             self.repl_views[r.id] = rv
+            monitor.start()
             view.set_scratch(True)
             view.set_name("*REPL* [%s]" % (r.name(),))
             return rv
@@ -502,7 +1614,9 @@ class ReplManager(object):
             traceback.print_exc()
             sublime.error_message(repr(e))
 
-    def restart(self, view, edit):
+    def restart(self, view, edit, replay=False):
+        """Starts REPL of view again, with replay its new process gets
+           commands entered since the last restart"""
         repl_restart_args = view.settings().get("repl_restart_args")
         if not repl_restart_args:
             sublime.message_dialog("No restart parameters found")
@@ -512,10 +1626,13 @@ class ReplManager(object):
             if rv.repl and rv.repl.is_alive() and not sublime.ok_cancel_dialog("Still running. Really restart?"):
                 return False
             rv.on_close()  # yes on_close, delete rv from
+        commands = rv.session_commands if rv and replay else []
 
         view.insert(edit, view.size(), RESTART_MSG)
         repl_restart_args["view_id"] = view.id()
-        self.open(view.window(), **repl_restart_args)
+        new_rv = self.open(view.window(), **repl_restart_args)
+        if new_rv:
+            new_rv.replay(commands)
         return True
 
     def _delete_repl(self, repl_view):
@@ -601,11 +1718,70 @@ class ReplManager(object):
         return dictionary
 
 manager = ReplManager()
+monitor = ResourceMonitor()
+
+
+def plugin_loaded():
+    # first REPL shouldn't wait for login shell
+    settings = sublime.load_settings(SETTINGS_FILE)
+    repls.subprocess_repl.refresh_login_env_async(settings.get("getenv_command"))
+
+
+def plugin_unloaded():
+    manager.pool.close()
 
 # Window Commands #########################################
 
 
 # Opens a new REPL
+class ReplListProcessesCommand(sublime_plugin.WindowCommand):
+    """Quick panel of REPLs sorted by memory use, offering to kill or restart them"""
+
+    ACTIONS = ["Show", "Kill", "Restart"]
+
+    def run(self):
+        repl_views = ResourceMonitor.processes()
+        if not repl_views:
+            sublime.status_message("SublimeREPL: no REPL processes")
+            return
+        if procstat.available():
+            # fresh numbers for REPLs the monitor didn't get to yet
+            missing = [rv for rv in repl_views if rv.resources is None]
+            for rv, usage in ResourceMonitor().sample(missing):
+                rv.resources = usage
+        repl_views.sort(key=lambda rv: rv.resources.rss if rv.resources else -1, reverse=True)
+        items = []
+        for rv in repl_views:
+            details = "pid %d" % rv.repl.pid()
+            usage = rv.resources
+            if usage is not None:
+                details += " | RSS %s | CPU %.0f%% | %d fds | %d processes" % (
+                    format_size(usage.rss), usage.cpu, usage.fds, usage.processes)
+            if not rv.repl.is_alive():
+                details += " | dead"
+            items.append([rv.repl.name(), details])
+        self._repl_views = repl_views
+        self.window.show_quick_panel(items, self.on_repl)
+
+    def on_repl(self, index):
+        if index < 0:
+            return
+        rv = self._repl_views[index]
+        # quick panel can't be shown from on_done of another one directly
+        sublime.set_timeout(lambda: self.window.show_quick_panel(
+            self.ACTIONS, lambda action: self.on_action(rv, action)), 10)
+
+    def on_action(self, rv, action):
+        if action < 0:
+            return
+        window = rv.view.window() or self.window
+        window.focus_view(rv.view)
+        if self.ACTIONS[action] == "Kill":
+            rv.repl.kill()
+        elif self.ACTIONS[action] == "Restart":
+            rv.view.run_command("repl_restart")
+
+
 class ReplOpenCommand(sublime_plugin.WindowCommand):
     def run(self, encoding, type, syntax=None, view_id=None, **kwds):
         manager.open(self.window, encoding, type, syntax, view_id, **kwds)
@@ -623,6 +1799,10 @@ class ReplRestartCommand(sublime_plugin.TextCommand):
     def is_enabled(self):
         return self.is_visible()
 
+class ReplRestartReplayCommand(ReplRestartCommand):
+    def run(self, edit):
+        manager.restart(self.view, edit, replay=True)
+
 # REPL Comands ############################################
 
 
@@ -722,6 +1902,82 @@ class ReplViewNextCommand(sublime_plugin.TextCommand):
             rv.next_command(edit)
 
 
+class ReplHistorySearchCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        search = HistorySearch.active
+        if search is not None:
+            # run again from the search panel
+            search.next_match()
+            return
+        rv = manager.repl_view(self.view)
+        if rv:
+            HistorySearch(rv).start(self.view.window())
+
+
+class ReplReplaceInputCommand(sublime_plugin.TextCommand):
+    def run(self, edit, text):
+        rv = manager.repl_view(self.view)
+        if not rv:
+            return
+        self.view.set_read_only(False)
+        if text:
+            rv.replace_current_input(edit, text)
+        else:
+            rv.escape(edit)
+
+
+class ReplOpenFullOutputCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        rv = manager.repl_view(self.view)
+        if rv:
+            rv.open_full_output()
+
+    def is_visible(self):
+        rv = manager.repl_view(self.view)
+        return bool(rv and rv._spills)
+
+    def is_enabled(self):
+        return self.is_visible()
+
+
+class ReplStatsCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        rv = manager.repl_view(self.view)
+        if not rv:
+            return
+        window = self.view.window()
+        if hasattr(window, "create_output_panel"):
+            panel = window.create_output_panel("repl_stats")
+        else:
+            panel = window.get_output_panel("repl_stats")
+        panel.run_command("repl_erase_text", {"start": 0, "end": panel.size()})
+        panel.run_command("repl_insert_text", {"pos": 0, "text": rv.stats.report()})
+        panel.set_read_only(True)
+        window.run_command("show_panel", {"panel": "output.repl_stats"})
+
+    def is_visible(self):
+        rv = manager.repl_view(self.view)
+        return bool(rv)
+
+    def is_enabled(self):
+        return self.is_visible()
+
+
+class ReplCancelInputCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        rv = manager.repl_view(self.view)
+        if rv:
+            rv.cancel_input()
+
+    def is_visible(self):
+        rv = manager.repl_view(self.view)
+        return bool(rv)
+
+    def is_enabled(self):
+        rv = manager.repl_view(self.view)
+        return bool(rv and rv.repl.pending_input())
+
+
 class ReplKillCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         rv = manager.repl_view(self.view)
@@ -144,6 +144,7 @@ class ReplSend(sublime_plugin.TextCommand):
             if sublime.load_settings(SETTINGS_FILE).get('show_transferred_text'):
                 rv.append_input_text(text)
                 rv.adjust_end()
+            rv.begin_evaluation()
             SENDERS[external_id](rv.repl, text, self.view, rv)
             break
         else: